@@ -0,0 +1,21 @@
+"""Import and warmup time of zhlib modules, each measured in a fresh interpreter."""
+import subprocess
+import sys
+
+STATEMENTS = [
+    'import zhlib.zh',
+    'import zhlib.level',
+    'import zhlib.export',
+    'import zhlib.zh; zhlib.zh.warmup()',
+]
+
+
+def bench(statement, repeat=5):
+    code = f'import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)'
+    return min(float(subprocess.check_output([sys.executable, '-c', code], stderr=subprocess.DEVNULL))
+               for _ in range(repeat))
+
+
+if __name__ == '__main__':
+    for statement in STATEMENTS:
+        print(f'{bench(statement) * 1000:8.1f} ms  {statement}')
@@ -2,49 +2,47 @@ from hanzilvlib.dictionary import HanziDict, VocabDict, SentenceDict
 from tqdm import tqdm
 
 from zhlib import zh
+from zhlib.loader import BulkLoader
+
+loader = BulkLoader()
 
 
 def init():
-    zh.database.create_tables([
-        zh.Hanzi, zh.Vocab, zh.Sentence,
-        zh.VocabHanzi, zh.SentenceHanzi, zh.SentenceVocab
-    ])
+    loader.create_tables()
 
 
 def fill_hanzi():
-    for k, v in tqdm(HanziDict().entries.items()):
-        zh.Hanzi.get_or_create(
-            hanzi=v['character'],
-            pinyin=v['pinyin'],
-            meaning=v['meaning'],
-            heisig=int(v['heisig']) if v['heisig'] and v['heisig'] != '10000' else None,
-            kanji=v['kanji']
-        )
+    loader.insert_many(zh.Hanzi, (dict(
+        hanzi=v['character'],
+        pinyin=v['pinyin'],
+        meaning=v['meaning'],
+        heisig=int(v['heisig']) if v['heisig'] and v['heisig'] != '10000' else None,
+        kanji=v['kanji']
+    ) for k, v in tqdm(HanziDict().entries.items())))
 
 
 def fill_vocab():
-    for k, v in tqdm(VocabDict().entries.items()):
-        zh.Vocab.get_or_create(
-            simplified=v['simplified'],
-            traditional=v['traditional'] if v['traditional'] != v['simplified'] else None,
-            pinyin=v['pinyin'],
-            english=v['english']
-        )
+    loader.load_vocab(dict(
+        simplified=v['simplified'],
+        traditional=v['traditional'] if v['traditional'] != v['simplified'] else None,
+        pinyin=v['pinyin'],
+        english=v['english']
+    ) for k, v in tqdm(VocabDict().entries.items()))
 
 
 def fill_sentence():
-    for k, v in tqdm(SentenceDict().entries.items()):
-        # print(v)
-        zh.Sentence.get_or_create(
-            sentence=v['sentence'],
-            pinyin=v['pinyin'],
-            english=v['english'],
-            order=int(v['order'])
-        )
+    loader.load_sentences(dict(
+        sentence=v['sentence'],
+        pinyin=v['pinyin'],
+        english=v['english'],
+        order=int(v['order'])
+    ) for k, v in tqdm(SentenceDict().entries.items()))
 
 
 if __name__ == '__main__':
-    # init()
-    # fill_hanzi()
-    # fill_vocab()
-    fill_sentence()
+    with zh.writable():
+        # init()
+        # fill_hanzi()
+        # fill_vocab()
+        fill_sentence()
+        loader.link()
@@ -0,0 +1,4 @@
+from zhlib import zh
+
+if __name__ == '__main__':
+    zh.build_component_index()
@@ -0,0 +1,14 @@
+import peewee as pv
+from playhouse.migrate import SqliteMigrator, migrate
+
+from zhlib import zh
+
+if __name__ == '__main__':
+    with zh.writable():
+        migrator = SqliteMigrator(zh.database)
+        migrate(
+            migrator.add_column('vocab', 'frequency', pv.FloatField(null=True)),
+            migrator.add_index('vocab', ('frequency',), False)
+        )
+
+    zh.build_frequency()
@@ -2,6 +2,7 @@ import peewee as pv
 from playhouse.migrate import SqliteMigrator, migrate
 
 from zhlib import zh
+from zhlib.loader import BulkLoader, read_junda
 
 
 if __name__ == '__main__':
@@ -10,13 +11,5 @@ if __name__ == '__main__':
     #     migrator.add_column('hanzi', 'junda', pv.IntegerField(null=True, unique=True))
     # )
 
-    with open('junda.txt') as f:
-        for row in f:
-            row = row.strip().split('\t')
-            if row:
-                junda = int(row[0])
-                hanzi = row[1]
-
-                db_hanzi = zh.Hanzi.get_or_create(hanzi=hanzi)[0]
-                db_hanzi.junda = junda
-                db_hanzi.save()
+    with zh.writable():
+        BulkLoader().load_hanzi(read_junda('junda.txt'))
@@ -0,0 +1,73 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from zhlib import zh
+from zhlib.loader import BulkLoader
+
+JUNDA = '的一是不了人我在有他这中大来上国个到说们为子和你地出道也时年'
+
+VOCAB = [
+    dict(simplified='中国', traditional='中國', pinyin='zhong1 guo2', english='China'),
+    dict(simplified='中文', pinyin='zhong1 wen2', english='Chinese language'),
+    dict(simplified='说话', traditional='說話', pinyin='shuo1 hua4', english='to speak'),
+    dict(simplified='卡拉OK', pinyin='ka3 la1 O K', english='karaoke'),
+    dict(simplified='大', pinyin='da4', english='big'),
+    dict(simplified='人', pinyin='ren2', english='person'),
+]
+
+SENTENCES = [
+    dict(sentence='我是中国人。', english="I'm Chinese.", order=0),
+    dict(sentence='他说话很大。', english='He speaks loudly.', order=1),
+    dict(sentence='我们去唱卡拉OK吧。', english="Let's go to karaoke.", order=2),
+    dict(sentence='中文很难。', english='Chinese is hard.', order=3),
+    dict(sentence='大家好！', english='Hello everyone!', order=4),
+]
+
+
+@pytest.fixture
+def database(tmp_path):
+    """A small dict.db built with BulkLoader, with the n-gram index"""
+    config = zh.get_config()
+    zh.configure(str(tmp_path / 'dict.db'), immutable=False)
+
+    with zh.writable():
+        loader = BulkLoader()
+        loader.create_tables()
+        loader.load_hanzi(dict(junda=i * 100 + 1, hanzi=h) for i, h in enumerate(JUNDA))
+        loader.load_vocab(VOCAB)
+        loader.load_sentences(SENTENCES)
+        loader.link()
+        loader.insert_many(zh.Tag, [dict(name='HSK_Level_1'), dict(name='HSK_Level_2')])
+        loader.insert_many(zh.HanziTag, [dict(hanzi=1, tag=1), dict(hanzi=1, tag=2)])
+        loader.insert_many(zh.VocabTag, [dict(vocab=1, tag=2)])
+        loader.insert_many(zh.SentenceTag, [dict(sentence=1, tag=1)])
+        zh.build_ngram_index()
+
+    yield zh.database
+
+    zh.configure(**config)
+
+
+def drop_ngram_index():
+    with zh.writable():
+        zh.database.drop_tables([zh.VocabGram, zh.SentenceGram])
+
+    zh._table_exists.clear()
+
+
+def replace_database(*statements):
+    """Replace the database file with a copy changed by statements, as when a new dict.db is installed"""
+    path = zh.get_config()['path']
+    new_path = path + '.new'
+    shutil.copyfile(path, new_path)
+
+    conn = sqlite3.connect(new_path)
+    with conn:
+        for statement in statements:
+            conn.execute(statement)
+    conn.close()
+
+    os.replace(new_path, path)
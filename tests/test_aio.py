@@ -0,0 +1,25 @@
+import asyncio
+
+from zhlib import aio, zh
+from zhlib.level import Level
+
+from .test_analysis import TEXT
+
+
+def test_aio_matches_blocking(database):
+    async def run():
+        async with aio.Client(max_workers=2, chunk_size=3) as client:
+            aio.set_client(client)
+            try:
+                return (await aio.analyze_text(TEXT),
+                        [await aio.search(s) for s in ('中', '中国', 'x')],
+                        await aio.search_many(['中', '中国', 'x', '大', '说话']))
+            finally:
+                aio.set_client(None)
+
+    analysis, found, found_many = asyncio.run(run())
+
+    level = Level(TEXT)
+    assert analysis == {'hanzi': level.hanzi, 'vocab': level.vocab}
+    assert found == [zh.search(s) for s in ('中', '中国', 'x')]
+    assert found_many == [zh.search(s) for s in ('中', '中国', 'x', '大', '说话')]
@@ -0,0 +1,72 @@
+from zhlib import zh
+from zhlib.level import Level, TextAnalysis, HanziLevel, IncrementalLevel, StreamingLevel
+from zhlib.snapshot import Snapshot
+
+from .conftest import replace_database
+
+TEXT = '''我是中国人。
+他说话很大。
+我们去唱卡拉OK吧。
+
+中文很难。大家好！'''
+
+
+def _unordered(items):
+    return sorted(map(repr, items))
+
+
+def test_snapshot_matches_models(database):
+    snapshot = Snapshot.build()
+    for h in zh.Hanzi.select():
+        assert snapshot.get_hanzi(h.hanzi).to_json() == h.to_json()
+        assert snapshot.get_level(h.hanzi) == HanziLevel.get_level_from_junda(h.junda)
+
+    for v in zh.Vocab.select():
+        for k in filter(None, (v.simplified, v.traditional)):
+            assert snapshot.match(k).to_json() == zh.Vocab.match_many([k])[k].to_json()
+
+    level = Level(TEXT)
+    assert Level(TEXT, snapshot=snapshot).hanzi == level.hanzi
+    assert Level(TEXT, snapshot=snapshot).vocab == level.vocab
+
+
+def test_incremental_level_matches_level(database):
+    incremental = IncrementalLevel()
+    lines = TEXT.split('\n')
+    for text in ['\n'.join(lines), '\n'.join(lines[:2] + ['中文不难。'] + lines[3:]), '\n'.join(lines[1:]), '']:
+        incremental.update(text)
+        level = Level(text)
+        assert incremental.analysis.hanzi == level.analysis.hanzi
+        assert incremental.analysis.vocab == level.analysis.vocab
+        assert _unordered(incremental.hanzi) == _unordered(level.hanzi)
+        assert _unordered(incremental.vocab) == _unordered(level.vocab)
+
+
+def test_streaming_level_matches_level(database, tmp_path):
+    path = tmp_path / 'corpus.txt'
+    path.write_text(TEXT, encoding='utf8')
+
+    for streaming, text in [(StreamingLevel(str(path), chunk_size=8), TEXT),
+                            (StreamingLevel(TEXT.splitlines(), chunk_size=8), TEXT),
+                            (StreamingLevel(['我爱中', '国人']), '我爱中\n国人')]:
+        streaming.run()
+        level = Level(text)
+        assert streaming.analysis.hanzi == level.analysis.hanzi
+        assert streaming.analysis.vocab == level.analysis.vocab
+        assert _unordered(streaming.hanzi) == _unordered(level.hanzi)
+        assert _unordered(streaming.vocab) == _unordered(level.vocab)
+
+
+def test_junda_table_follows_database_file(database):
+    assert HanziLevel.get_level('中') == HanziLevel.get_level_from_junda(zh.Hanzi.get(hanzi='中').junda)
+
+    with zh.writable():
+        zh.Hanzi.update(junda=5001).where(zh.Hanzi.hanzi == '中').execute()
+
+    # Batches look for changes; single lookups then see what they found
+    assert TextAnalysis('中国').hanzi_levels['中'] == (5001, Level.TIER_MAX)
+    assert HanziLevel.get_level('中') == (5001, Level.TIER_MAX)
+
+    replace_database("UPDATE hanzi SET junda = 5002 WHERE hanzi = '中'")
+    assert TextAnalysis('中国').hanzi_levels['中'] == (5002, Level.TIER_MAX)
+    assert HanziLevel.get_level('中') == (5002, Level.TIER_MAX)
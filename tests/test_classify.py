@@ -0,0 +1,45 @@
+import pytest
+
+from zhlib import classify
+from zhlib.level import VocabLevel
+
+pytest.importorskip('numpy')
+
+WORDS = ['的', '中国', '说话', '我们', '卡拉OK', '氨基酸', '龘龘龘龘', 'qzxqzx', '中国', '的', 'qzxqzx']
+
+
+@pytest.mark.parametrize('words', [WORDS, WORDS[:1], []])
+def test_tier_matches_vocab_level(words):
+    result = classify.classify_vocab(words)
+    assert result.tier.tolist() == [VocabLevel.get_level(w)[1] for w in words]
+    assert result.frequency.tolist() == [VocabLevel.get_level(w)[0] for w in words]
+    assert len(result.hsk) == len(words)
+
+
+def test_zero_frequency_is_the_last_tier():
+    result = classify.classify_vocab(['qzxqzx'])
+    assert result.frequency.tolist() == [0]
+    assert result.tier.tolist() == [VocabLevel.get_level('qzxqzx')[1]] == [classify.Level.TIER_MAX]
+    assert result.hsk.tolist() == [classify.HSK_NONE]
+
+
+def test_hsk_follows_bands(monkeypatch):
+    bands = classify.get_hsk_bands()
+    frequencies = dict()
+    expected = []
+    for lv, lo, hi in bands:
+        frequencies[f'min{lv}'] = lo
+        frequencies[f'above{lv}'] = lo * 1.01
+        frequencies[f'below{lv}'] = lo * 0.99
+        expected.extend([
+            (f'min{lv}', lv),
+            (f'above{lv}', lv),
+            # The lowest level whose band reaches down to the frequency
+            (f'below{lv}', next((lv2 for lv2, lo2, _ in bands if lo * 0.99 >= lo2), classify.HSK_NONE))
+        ])
+    frequencies['rare'] = 0
+
+    monkeypatch.setattr(classify, 'word_frequency',
+                        lambda w, lang: frequencies[w] / VocabLevel.FREQ_FACTOR)
+    words = [w for w, _ in expected] + ['rare']
+    assert classify.classify_vocab(words).hsk.tolist() == [lv for _, lv in expected] + [classify.HSK_NONE]
@@ -0,0 +1,23 @@
+from zhlib.corpus import analyze_corpus, _histogram
+from zhlib.level import TextAnalysis
+
+DOCUMENTS = {
+    'a': '我是中国人。\n他说话很大。',
+    'b': '我们去唱卡拉OK吧。\n中文很难。大家好！我是中国人。'
+}
+
+
+def _summary(analysis):
+    return {
+        'hanzi': _histogram(analysis.hanzi_levels[h] for h in analysis.hanzi),
+        'vocab': _histogram(analysis.vocab_levels[v] for v in analysis.vocab),
+        'hanzi_count': sum(analysis.hanzi.values()),
+        'vocab_count': sum(analysis.vocab.values())
+    }
+
+
+def test_corpus_matches_concatenated_text(database):
+    result = analyze_corpus(DOCUMENTS, processes=2)
+
+    assert result['corpus'] == _summary(TextAnalysis('\n'.join(DOCUMENTS.values())))
+    assert result['documents'] == dict((name, _summary(TextAnalysis(text))) for name, text in DOCUMENTS.items())
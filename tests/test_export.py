@@ -0,0 +1,26 @@
+import pytest
+
+from zhlib.export import AnkiExporter
+
+
+@pytest.mark.parametrize('type_, tags, deck', [
+    # Hanzi go by tier, unless they have any HSK tag
+    ('Hanzi', ['zhlib', 'hanzi', 'tier2', '2026-10-18'], 'Chinese::Hanzi::tier2'),
+    ('Hanzi', ['zhlib', 'hanzi', 'tier2', 'HSK_Level_1'], None),
+    ('Hanzi', ['zhlib', 'hanzi', 'tier6'], 'Chinese::Hanzi::tier6'),
+    # Vocab go by HSK level, the last one winning, then by tier if they have no HSK tag
+    ('Vocab', ['zhlib', 'vocab', 'tier3', 'HSK_Level_2'], 'Chinese::Vocab::HSK2'),
+    ('Vocab', ['zhlib', 'vocab', 'tier3', 'HSK_Level_2', 'HSK_Level_5'], 'Chinese::Vocab::HSK5'),
+    ('Vocab', ['zhlib', 'vocab', 'HSK_Level_5', 'HSK_Level_1'], 'Chinese::Vocab::HSK5'),
+    ('Vocab', ['zhlib', 'vocab', 'tier3'], 'Chinese::Vocab::tier3'),
+    ('Vocab', ['zhlib', 'vocab', 'tier3', 'HSK_other'], None),
+    # No tier tag
+    ('Hanzi', ['zhlib', 'hanzi'], None),
+    ('Vocab', ['zhlib', 'vocab'], None),
+    ('Vocab', ['zhlib', 'vocab', 'tier7'], None),
+    # Not of that type
+    ('Vocab', ['zhlib', 'hanzi', 'tier1', 'HSK_Level_1'], None),
+    ('Hanzi', ['zhlib', 'vocab', 'tier1'], None),
+])
+def test_deck_name(type_, tags, deck):
+    assert AnkiExporter.deck_name(type_, tags) == deck
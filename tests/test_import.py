@@ -0,0 +1,20 @@
+import subprocess
+import sys
+
+HEAVY_MODULES = ('cjkradlib', 'jieba', 'wordfreq', 'mistune', 'ankisync', 'simplesrs')
+
+
+def _imported_after(module):
+    out = subprocess.check_output([
+        sys.executable, '-c',
+        f'import sys, {module}; print(" ".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+    ])
+    return out.decode().split()
+
+
+def test_zh_import_is_lazy():
+    assert _imported_after('zhlib.zh') == []
+
+
+def test_export_import_is_lazy():
+    assert _imported_after('zhlib.export') == []
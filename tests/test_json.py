@@ -0,0 +1,112 @@
+import pytest
+
+from zhlib import zh
+
+from .conftest import replace_database
+
+
+def _tags(m):
+    return [t.name for t in m.tags.order_by(zh.Tag.id)]
+
+
+def _hanzi_json(h):
+    return dict(zh.BaseModel.to_json(h), **{
+        'vocabs': [str(v) for v in zh.Vocab.search(h.hanzi).order_by(*zh.Vocab.frequency_order()).limit(10)],
+        'sentences': [str(s) for s in h.get_sentences(10)],
+        'tags': _tags(h)
+    })
+
+
+def _vocab_json(v):
+    d = zh.BaseModel.to_json(v)
+    d.pop('frequency')
+    return dict(d, **{
+        'sentences': [str(s) for s in v.get_sentences(10)],
+        'tags': _tags(v)
+    })
+
+
+def _sentence_json(s):
+    return dict(zh.BaseModel.to_json(s), **{
+        'vocab': [str(v) for v in s.vocabs.order_by(*zh.Vocab.frequency_order()).limit(10)],
+        'tags': _tags(s)
+    })
+
+
+def test_to_json_many_matches_per_object(database):
+    for model, expected in [(zh.Hanzi, _hanzi_json), (zh.Vocab, _vocab_json), (zh.Sentence, _sentence_json)]:
+        models = list(model.select())
+        assert model.to_json_many(models) == [expected(m) for m in models]
+
+        zh.json_cache.clear()
+        assert [m.to_json() for m in models] == [expected(m) for m in models]
+
+
+def test_to_json_many_is_not_affected_by_the_cache(database):
+    hanzis = list(zh.Hanzi.select())
+    fresh = zh.Hanzi.to_json_many(hanzis)
+    cached = zh.Hanzi.to_json_many(hanzis)
+    assert cached == fresh
+
+    cached[0]['tags'].append('modified')
+    assert zh.Hanzi.to_json_many(hanzis) == fresh
+
+
+def test_modified_instances_are_not_cached(database):
+    h = zh.Hanzi.get(hanzi='中')
+    h.to_json()
+    h.meaning = 'changed'
+    assert h.to_json()['meaning'] == 'changed'
+    assert zh.Hanzi.get(hanzi='中').to_json()['meaning'] != 'changed'
+
+
+def test_in_memory_results_are_not_cached(database):
+    zh.configure(zh.get_config()['path'], in_memory=True)
+    assert zh.search('中') == zh.search('中')
+    zh.Hanzi.get(hanzi='中').to_json()
+    with zh.writable():
+        zh.Hanzi.update(meaning='changed').where(zh.Hanzi.hanzi == '中').execute()
+
+    assert zh.search('中')['meaning'] == 'changed'
+    assert zh.Hanzi.get(hanzi='中').to_json()['meaning'] == 'changed'
+    assert len(zh.search_cache) == len(zh.json_cache) == 0
+
+
+@pytest.mark.parametrize('immutable', [False, True])
+def test_results_follow_replaced_file(database, immutable):
+    zh.configure(zh.get_config()['path'], immutable=immutable)
+    assert zh.search('中')['meaning'] is None
+    assert zh.Hanzi.get(hanzi='中').to_json()['meaning'] is None
+
+    replace_database("UPDATE hanzi SET meaning = 'middle' WHERE hanzi = '中'")
+    assert zh.search('中')['meaning'] == 'middle'
+    assert zh.Hanzi.get(hanzi='中').to_json()['meaning'] == 'middle'
+
+
+def test_top_k_many_keeps_the_order_of_each_query(database):
+    for queries in [
+        {
+            1: zh.Vocab.select().order_by(zh.Vocab.id.desc()).limit(3),
+            2: zh.Vocab.select().order_by(zh.Vocab.id).limit(3),
+            3: zh.Vocab.select().order_by(*zh.Vocab.frequency_order())
+        },
+        dict((h.id, h.get_sentences(10)) for h in zh.Hanzi.select())
+    ]:
+        result = zh._top_k_many(queries, chunk_size=2)
+        assert dict((k, [m.id for m in v]) for k, v in result.items()) == \
+            dict((k, [m.id for m in q]) for k, q in queries.items() if q)
+
+
+def test_database_without_frequency(database, caplog):
+    expected = [v.to_json() for v in zh.Vocab.select().order_by(zh.Vocab.id)]
+    replace_database('DROP INDEX vocab_frequency', 'ALTER TABLE vocab DROP COLUMN frequency')
+    zh.configure(zh.get_config()['path'])
+
+    assert [v.to_json() for v in zh.Vocab.select().order_by(zh.Vocab.id)] == expected
+    assert not zh.has_frequency()
+    assert 'migration.add_frequency' in caplog.text
+    assert zh.Vocab.frequency_order() == [zh.Vocab.id]
+    assert [v.id for v in zh.Hanzi.get(hanzi='中').vocabs]
+    assert zh.Sentence.get(id=1).to_json()['vocab']
+    assert zh.search('中国')['simplified'] == '中国'
+    assert zh.Hanzi.get(hanzi='中').to_json()['vocabs']
@@ -1,8 +1,8 @@
-from zhlib.level import Level
+from zhlib.level import Level, TextAnalysis
 from prettyprinter import pprint
 
 if __name__ == '__main__':
-    pprint(Level().search_text('''
+    analysis = TextAnalysis('''
 # 注意
 
 1. 中国人的姓和名
@@ -45,4 +45,8 @@ if __name__ == '__main__':
     3. 构字部件：此类偏旁与汉子的意思及发音无关，用做部件仅为在形体上区别于其他汉字。
         - 另外，同一个偏旁，在一个汉子中可能起表意作用，而在另一个汉字中则可能起表音作用，或者仅作为构字部件。例如：
             - 门
-    '''))
+    ''')
+    level = Level(analysis)
+    pprint(level.hanzi)
+    pprint(level.vocab)
+    pprint(analysis.vocab.most_common(20))
@@ -0,0 +1,39 @@
+from zhlib import zh
+from zhlib.loader import BulkLoader
+
+from .conftest import drop_ngram_index
+
+
+def test_loading_keeps_ngram_index_current(database):
+    with zh.writable():
+        loader = BulkLoader()
+        loader.load_vocab([dict(simplified='大海', pinyin='da4 hai3', english='sea')])
+        loader.load_sentences([dict(sentence='我爱大海。', order=5)])
+        loader.link_tokens([(zh.Sentence.get(sentence='我爱大海。').id, ({'我', '爱', '大', '海'}, {'爱', '大海'}))])
+
+    found = (sorted(v.simplified for v in zh.Vocab.search('大')),
+             sorted(s.sentence for s in zh.Sentence.search('大海')),
+             sorted(v.simplified for v in zh.Vocab.search('爱')))
+    assert '大海' in found[0] and found[1] == ['我爱大海。'] and found[2] == ['爱']
+    assert '大海' in ' '.join(zh.Hanzi.get(hanzi='大').to_json()['vocabs'])
+
+    drop_ngram_index()
+    assert (sorted(v.simplified for v in zh.Vocab.search('大')),
+            sorted(s.sentence for s in zh.Sentence.search('大海')),
+            sorted(v.simplified for v in zh.Vocab.search('爱'))) == found
+
+
+def _links():
+    # Without ids, which follow the order of sets
+    return [sorted(row[1:] for row in model.select().tuples())
+            for model in (zh.VocabHanzi, zh.SentenceHanzi, zh.SentenceVocab)]
+
+
+def test_relink_in_processes_matches_in_process(database):
+    with zh.writable():
+        BulkLoader().relink()
+        expected = _links()
+        BulkLoader().relink(processes=2)
+
+    assert all(expected)
+    assert _links() == expected
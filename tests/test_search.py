@@ -0,0 +1,69 @@
+import pytest
+
+from zhlib import zh
+
+from .conftest import drop_ngram_index
+
+QUERIES = ['ok', 'OK', 'Ok', '卡拉ok', '中', '中国', '中國', '说话很', '我们去', 'x', '']
+
+
+def _found(q):
+    return (sorted(v.id for v in zh.Vocab.search(q)),
+            sorted(s.id for s in zh.Sentence.search(q)))
+
+
+def test_ngram_index_matches_like(database):
+    assert zh.has_ngram_index()
+    indexed = [_found(q) for q in QUERIES]
+    assert indexed[0][0], '卡拉OK should be found by ok'
+
+    drop_ngram_index()
+    assert not zh.has_ngram_index()
+    assert [_found(q) for q in QUERIES] == indexed
+
+
+def test_limited_sentences_match_unlimited(database):
+    zh.build_link_indexes()
+    for model in (zh.Hanzi.select(), zh.Vocab.select()):
+        for m in model:
+            assert [s.id for s in m.get_sentences(2)] == [s.id for s in m.get_sentences()][:2]
+
+
+def test_search_many_matches_search(database):
+    strings = ['中', '中国', '中國', '卡拉OK', '我是中国人。', '大', 'x', '', '中']
+    many = zh.search_many(strings)
+
+    zh.search_cache.clear()
+    zh.json_cache.clear()
+    expected = [zh.search(s) for s in strings]
+    assert many == expected
+
+    # With both forms of 中国 in different chunks
+    zh.search_cache.clear()
+    zh.json_cache.clear()
+    assert zh.search_many(strings, chunk_size=1) == expected
+
+
+def test_search_components_needs_components(database):
+    with pytest.raises(TypeError):
+        zh.Hanzi.search_components()
+
+
+def test_search_components_index_matches_fallback(database):
+    queries = [('口',), ('一',), ('亻',), ('一', '十'), ('口', '丿')]
+
+    def found(components, limit=None):
+        return [h.hanzi for h in zh.Hanzi.search_components(*components, limit=limit)]
+
+    assert not zh._has_tables(zh.HanziComponent)
+    fallback = [found(q) for q in queries]
+    # By junda, then hanzi without junda by id
+    hanzis = sorted(zh.Hanzi.select(), key=lambda h: (h.junda is None, h.junda, h.id))
+    assert fallback == [[h.hanzi for h in hanzis if set(q) <= zh.get_components(h.hanzi)] for q in queries]
+    assert all(len(hanzis) > 1 for hanzis in fallback)
+
+    zh.build_radical_table()
+    zh.build_component_index()
+    assert zh._has_tables(zh.HanziComponent)
+    assert [found(q) for q in queries] == fallback
+    assert [found(q, limit=2) for q in queries] == [hanzis[:2] for hanzis in fallback]
@@ -0,0 +1,147 @@
+"""
+asyncio facade over zh and level, for use inside an event loop (e.g. aiohttp).
+
+    from zhlib import aio
+
+    result = await aio.search('中')
+    analysis = await aio.analyze_text(text)
+    async for level, tier, hanzi in aio.iter_hanzi_level(text):
+        ...
+
+Blocking work (SQLite, jieba) runs on a bounded pool of threads, each with its own read connection.
+Long analyses are split into jobs of CHUNK_SIZE items, so that a large document takes turns
+with other requests instead of holding the pool, and so that cancelling stops it at the next chunk.
+"""
+import asyncio
+import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+
+from . import zh
+from .level import TextAnalysis, HanziLevel, VocabLevel
+
+MAX_WORKERS = 4
+CHUNK_SIZE = zh.CHUNK_SIZE
+
+_client = None
+
+
+def _connect():
+    zh.database.connect(reuse_if_open=True)
+
+
+class Client:
+    def __init__(self, max_workers=MAX_WORKERS, max_pending=None, chunk_size=CHUNK_SIZE):
+        """
+        :param max_workers: number of threads, hence of database connections
+        :param max_pending: number of jobs queued or running at once, beyond which callers wait their turn;
+        defaults to max_workers
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending or max_workers
+        self.chunk_size = chunk_size
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='zhlib', initializer=_connect)
+        self._semaphore = None
+
+    async def run(self, func, *args, **kwargs):
+        """Run func in the pool, once there is room for it"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, partial(func, *args, **kwargs)
+            )
+
+    async def search(self, s):
+        return await self.run(zh.search, s)
+
+    async def search_many(self, strings):
+        strings = list(strings)
+        results = []
+        for i in range(0, len(strings), self.chunk_size):
+            results.extend(await self.run(zh.search_many, strings[i:i + self.chunk_size]))
+
+        return results
+
+    async def iter_hanzi_level(self, text, **kwargs):
+        """Async iterator over ``HanziLevel(text, **kwargs)``"""
+        async for item in self._iter(HanziLevel(text, **kwargs)):
+            yield item
+
+    async def iter_vocab_level(self, text, **kwargs):
+        """Async iterator over ``VocabLevel(text, **kwargs)``"""
+        async for item in self._iter(VocabLevel(text, **kwargs)):
+            yield item
+
+    async def analyze_text(self, text, jsonify=True):
+        """:return: ``{'hanzi': Level(text).hanzi, 'vocab': Level(text).vocab}``"""
+        analysis = TextAnalysis.of(text)
+        hanzi = [item async for item in self.iter_hanzi_level(analysis, jsonify=jsonify)]
+        vocab = [item async for item in self.iter_vocab_level(analysis, jsonify=jsonify)]
+
+        return {
+            'hanzi': sorted(hanzi, key=lambda x: x[0] if x[0] else math.inf),
+            'vocab': sorted(vocab, key=lambda x: -x[0])
+        }
+
+    async def _iter(self, iterable):
+        it = iter(iterable)
+        try:
+            while True:
+                chunk = await self.run(lambda: list(islice(it, self.chunk_size)))
+                if not chunk:
+                    return
+
+                for item in chunk:
+                    yield item
+        finally:
+            try:
+                it.close()
+            except (AttributeError, ValueError):
+                # Not a generator, or a cancelled step is still running it; it will be collected either way.
+                pass
+
+    def close(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+
+def get_client():
+    """The Client behind the module-level functions, created on first use"""
+    global _client
+    if _client is None:
+        _client = Client()
+
+    return _client
+
+
+def set_client(client):
+    global _client
+    _client = client
+
+
+async def search(s):
+    return await get_client().search(s)
+
+
+async def search_many(strings):
+    return await get_client().search_many(strings)
+
+
+async def analyze_text(text, jsonify=True):
+    return await get_client().analyze_text(text, jsonify=jsonify)
+
+
+def iter_hanzi_level(text, **kwargs):
+    return get_client().iter_hanzi_level(text, **kwargs)
+
+
+def iter_vocab_level(text, **kwargs):
+    return get_client().iter_vocab_level(text, **kwargs)
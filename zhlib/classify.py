@@ -0,0 +1,58 @@
+"""
+Tiers and HSK levels of whole vocab lists at once, with NumPy (an optional dependency).
+
+    result = classify_vocab(words)
+    result.tier[i], result.hsk[i]   # of words[i]
+
+Tiers are the same as VocabLevel.get_level. HSK levels are estimated from freq.json,
+the frequency bands of the HSK vocab lists, as computed by dev/classify.py.
+"""
+import json
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+from .level import Level, VocabLevel
+from .util import word_frequency
+
+FREQ_PATH = Path(__file__).with_name('freq.json')
+HSK_MIN = 1
+HSK_MAX = 6
+# HSK level of words rarer than any HSK word
+HSK_NONE = 0
+
+Classification = namedtuple('Classification', ('words', 'frequency', 'tier', 'hsk'))
+
+
+@lru_cache(maxsize=None)
+def get_hsk_bands():
+    """:return: ``[(level, min frequency, max frequency)]``, frequencies per million words as in VocabLevel"""
+    with FREQ_PATH.open(encoding='utf8') as f:
+        d = json.load(f)
+
+    return [(lv, d[f'HSK_Level_{lv}']['min'], d[f'HSK_Level_{lv}']['max']) for lv in range(HSK_MIN, HSK_MAX + 1)]
+
+
+def classify_vocab(words):
+    """
+    :param words: sequence or array of str
+    :return: Classification of NumPy arrays aligned with words: frequency (per million words), tier, and hsk,
+    the lowest HSK level whose band reaches down to the frequency, or HSK_NONE
+    """
+    import numpy as np
+
+    words = np.asarray(words, dtype=object)
+    unique, inverse = np.unique(words, return_inverse=True)
+    frequency = np.fromiter((word_frequency(w, 'zh') for w in unique), dtype=float, count=len(unique))
+    frequency = frequency[inverse.reshape(-1)] * VocabLevel.FREQ_FACTOR
+
+    with np.errstate(divide='ignore'):
+        tier = 7 - np.ceil(np.log10(frequency) * 2)
+    tier[~np.isfinite(tier)] = Level.TIER_MAX
+    tier = np.clip(tier, Level.TIER_MIN, Level.TIER_MAX).astype(int)
+
+    levels, mins, _ = (np.array(a) for a in zip(*get_hsk_bands()))
+    reached = frequency[:, None] >= mins[None, :]
+    hsk = np.where(reached.any(axis=1), levels[reached.argmax(axis=1)], HSK_NONE)
+
+    return Classification(words, frequency, tier, hsk)
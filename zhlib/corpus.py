@@ -0,0 +1,116 @@
+"""
+Tier histograms of many documents at once, segmented over a process pool.
+
+    python -m zhlib.corpus texts/ --processes 8 > levels.json
+
+Workers only segment, with jieba initialized once per worker. Every distinct hanzi and vocab
+of the whole corpus is then looked up once, in the parent process, see :class:`TextAnalysis`.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+from collections import Counter
+from pathlib import Path
+
+from .level import Level, TextAnalysis
+from .util import progress_bar
+
+DOCUMENT_CHUNK_SIZE = 4
+
+
+def _init_worker():
+    import jieba
+
+    jieba.initialize()
+
+
+def _segment(args):
+    name, path, text, encoding = args
+    if text is None:
+        with open(path, encoding=encoding) as f:
+            text = f.read()
+
+    analysis = TextAnalysis(text)
+    return name, analysis.hanzi, analysis.vocab
+
+
+def _histogram(levels):
+    histogram = Counter(tier for _, tier in levels)
+    return dict((tier, histogram[tier]) for tier in range(Level.TIER_MIN, Level.TIER_MAX + 1))
+
+
+def iter_documents(documents, pattern='*.txt'):
+    """
+    :param documents: directory (searched recursively for pattern), iterable of file paths, or ``{name: text}``
+    :return: ``(name, path, text)``, where only one of path and text is set
+    """
+    if isinstance(documents, dict):
+        for name, text in documents.items():
+            yield name, None, text
+        return
+
+    if isinstance(documents, (str, os.PathLike)):
+        documents = sorted(Path(documents).rglob(pattern))
+
+    for path in documents:
+        yield str(path), str(path), None
+
+
+def analyze_corpus(documents, processes=None, pattern='*.txt', encoding='utf8'):
+    """
+    :param documents: see :func:`iter_documents`
+    :param processes: size of the segmenting pool; defaults to the number of CPUs
+    :return: ``{'documents': {name: summary}, 'corpus': summary}``, where a summary is
+    ``{'hanzi': {tier: number of distinct hanzi}, 'vocab': {tier: ...}, 'hanzi_count': ..., 'vocab_count': ...}``,
+    the last two being numbers of occurrences
+    """
+    args = [(name, path, text, encoding) for name, path, text in iter_documents(documents, pattern)]
+
+    with multiprocessing.Pool(processes, initializer=_init_worker) as pool:
+        segmented = list(progress_bar(pool.imap(_segment, args, chunksize=DOCUMENT_CHUNK_SIZE),
+                                      total=len(args), desc='Segmenting'))
+
+    corpus = TextAnalysis.from_counts()
+    for _, hanzi, vocab in segmented:
+        corpus.hanzi.update(hanzi)
+        corpus.vocab.update(vocab)
+
+    hanzi_levels = corpus.hanzi_levels
+    vocab_levels = corpus.vocab_levels
+
+    def summarize(hanzi, vocab):
+        return {
+            'hanzi': _histogram(hanzi_levels[h] for h in hanzi),
+            'vocab': _histogram(vocab_levels[v] for v in vocab),
+            'hanzi_count': sum(hanzi.values()),
+            'vocab_count': sum(vocab.values())
+        }
+
+    return {
+        'documents': dict((name, summarize(hanzi, vocab)) for name, hanzi, vocab in segmented),
+        'corpus': summarize(corpus.hanzi, corpus.vocab)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tier histograms of a corpus, as JSON.')
+    parser.add_argument('documents', nargs='+', help='directories or text files')
+    parser.add_argument('--pattern', default='*.txt', help='files to analyze in directories')
+    parser.add_argument('--processes', type=int, help='defaults to the number of CPUs')
+    parser.add_argument('--encoding', default='utf8')
+    args = parser.parse_args(argv)
+
+    paths = []
+    for document in args.documents:
+        if os.path.isdir(document):
+            paths.extend(p for _, p, _ in iter_documents(document, args.pattern))
+        else:
+            paths.append(document)
+
+    result = analyze_corpus(paths, processes=args.processes, encoding=args.encoding)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,52 @@
 from datetime import datetime
+import multiprocessing
 import peewee
-import simplesrs as srs
-import mistune
 import logging
-from ankisync.anki import Anki
-from ankisync.apkg import Apkg
-from ankisync.presets import get_wanki_min_dconf
 
-from .level import HanziLevel, VocabLevel
-from .util import progress_bar
+from .level import TextAnalysis, HanziLevel, VocabLevel
+from .util import progress_bar, chunks
 from . import zh
 
-markdown = mistune.Markdown()
+_markdown = None
+
+
+def markdown(text):
+    """mistune, imported and set up on first use"""
+    global _markdown
+    if _markdown is None:
+        import mistune
+        _markdown = mistune.Markdown()
+
+    return _markdown(text)
+
+
+def get_wanki_min_dconf():
+    from ankisync.presets import get_wanki_min_dconf
+
+    return get_wanki_min_dconf()
+
+
+class _Markdown:
+    """Class attribute holding markdown source, rendered on first access"""
+    def __init__(self, text):
+        self.text = text
+        self.html = None
+
+    def __get__(self, instance, owner):
+        if self.html is None:
+            self.html = markdown(self.text)
+
+        return self.html
 
 
 class AnkiExporter:
     MODEL_HANZI = 'zhlib_hanzi'
     MODEL_VOCAB = 'zhlib_vocab'
     DECK_CONFIG = 'wanki.min'
+    BATCH_SIZE = 500
+    POOL_CHUNK_SIZE = 100
 
-    HANZI_A_FORMAT = markdown('''
+    HANZI_A_FORMAT = _Markdown('''
 # {{hanzi}}
 ---
 ## {{pinyin}}
@@ -36,7 +63,7 @@ Heisig: {{heisig}}
 #### Sentence
 {{sentences}}
     ''')
-    VOCAB_A_FORMAT = markdown('''
+    VOCAB_A_FORMAT = _Markdown('''
 # {{simplified}}
 ---
 ## {{pinyin}}
@@ -51,8 +78,17 @@ Frequency: {{frequency}}
 {{sentences}}
     ''')
 
-    def __init__(self, apkg_filename=None):
+    def __init__(self, apkg_filename=None, processes=None):
+        """
+        :param processes: if given, notes are built in a pool of that many processes,
+        each with its own read-only connection to dict.db; the collection is still written here, serially.
+        """
+        self.processes = processes
+        self._pool = None
+
         if apkg_filename:
+            from ankisync.apkg import Apkg
+
             self.anki = Apkg(apkg_filename, disallow_unsafe=None)
             self.anki.init(
                 first_model=self._build_model_vocab(),
@@ -60,6 +96,8 @@ Frequency: {{frequency}}
                 first_dconf=get_wanki_min_dconf()
             )
         else:
+            from ankisync.anki import Anki
+
             self.anki = Anki(disallow_unsafe=None)
 
     def __enter__(self):
@@ -69,18 +107,51 @@ Frequency: {{frequency}}
         return self.close()
 
     def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
         return getattr(self.anki, 'close', lambda: None)()
 
-    def search_text(self, text):
-        hanzis = []
-        for f, t, hanzi in progress_bar(HanziLevel(text, jsonify=False), desc='Extracting Hanzi'):
-            hanzis.append(hanzi)
-        self.add_hanzis(progress_bar(hanzis, desc='Adding Hanzi'))
+    def _build_notes(self, type_, items, window=None):
+        """
+        :param window: with processes, items are handed to the pool this many at a time (default BATCH_SIZE),
+        as Pool.imap would otherwise drain all of them at once, in a background thread
+        """
+        if not self.processes:
+            build_note = self._build_hanzi_note if type_ == 'Hanzi' else self._build_vocab_note
+            return (build_note(item) for item in items)
+
+        return self._build_notes_pooled(type_, items, window or self.BATCH_SIZE)
+
+    def _build_notes_pooled(self, type_, items, window):
+        if self._pool is None:
+            # Spawned, not forked, so that no worker inherits this process's SQLite connection.
+            self._pool = multiprocessing.get_context('spawn').Pool(
+                self.processes, initializer=_init_worker, initargs=(zh.get_config(),)
+            )
 
-        vocabs = []
-        for f, t, vocab in progress_bar(VocabLevel(text, jsonify=False), desc='Extracting vocab'):
-            vocabs.append(vocab)
-        self.add_vocabs(progress_bar(vocabs, desc='Adding vocab'))
+        for window_items in chunks(items, window):
+            refs = [(type_, [_to_ref(item) for item in chunk])
+                    for chunk in chunks(window_items, self.POOL_CHUNK_SIZE)]
+            for notes in self._pool.imap(_build_notes_worker, refs):
+                yield from notes
+
+    def search_text(self, text, batch_size=BATCH_SIZE):
+        """
+        Extract, build and upsert notes in chunks of batch_size, each chunk in its own transaction,
+        so that memory does not grow with the text, and an interrupted run keeps the finished chunks.
+
+        :param text: str, or TextAnalysis
+        """
+        analysis = TextAnalysis.of(text)
+
+        hanzis = (hanzi for f, t, hanzi in progress_bar(HanziLevel(analysis, jsonify=False), desc='Adding Hanzi'))
+        self.add_hanzis(hanzis, batch_size=batch_size)
+
+        vocabs = (vocab for f, t, vocab in progress_bar(VocabLevel(analysis, jsonify=False), desc='Adding vocab'))
+        self.add_vocabs(vocabs, batch_size=batch_size)
 
     def _build_model_hanzi(self):
         field_names = [
@@ -107,16 +178,14 @@ Frequency: {{frequency}}
     def add_model_hanzi(self):
         self.anki.add_model(**self._build_model_hanzi())
 
-    def add_hanzis(self, hanzis):
+    def add_hanzis(self, hanzis, batch_size=None):
         if self.MODEL_HANZI not in self.anki.model_names():
             self.add_model_hanzi()
 
-        note_ids = self.anki.upsert_notes([self._build_hanzi_note(hanzi) for hanzi in hanzis])
+        self._upsert_notes('Hanzi', self._build_notes('Hanzi', hanzis, window=batch_size), batch_size=batch_size)
 
-        for i in range(1, 7):
-            self.change_deck('Hanzi', i, note_ids)
-
-    def _build_hanzi_note(self, hanzi):
+    @classmethod
+    def _build_hanzi_note(cls, hanzi):
         timestamp = datetime.now().strftime('%Y-%m-%d')
 
         note_data_defaults = dict(hanzi)
@@ -134,7 +203,7 @@ Frequency: {{frequency}}
 
         return {
             'deckId': 1,
-            'modelName': self.MODEL_HANZI,
+            'modelName': cls.MODEL_HANZI,
             'fields': {
                 'hanzi': h_key,
                 'defaults': dict((k, str(v)) for k, v in note_data_defaults.items() if v is not None)
@@ -166,17 +235,14 @@ Frequency: {{frequency}}
     def add_model_vocab(self):
         self.anki.add_model(**self._build_model_vocab())
 
-    def add_vocabs(self, vocabs):
+    def add_vocabs(self, vocabs, batch_size=None):
         if self.MODEL_VOCAB not in self.anki.model_names():
             self.add_model_vocab()
 
-        note_ids = self.anki.upsert_notes([self._build_vocab_note(vocab) for vocab in vocabs])
-
-        for i in range(1, 7):
-            self.change_deck_hsk(i, note_ids)
-            self.change_deck('Vocab', i, note_ids)
+        self._upsert_notes('Vocab', self._build_notes('Vocab', vocabs, window=batch_size), batch_size=batch_size)
 
-    def _build_vocab_note(self, vocab):
+    @classmethod
+    def _build_vocab_note(cls, vocab):
         timestamp = datetime.now().strftime('%Y-%m-%d')
 
         note_data_defaults = dict(vocab)
@@ -196,7 +262,7 @@ Frequency: {{frequency}}
 
         return {
             'deckId': 1,
-            'modelName': self.MODEL_VOCAB,
+            'modelName': cls.MODEL_VOCAB,
             'fields': {
                 'simplified': simplified,
                 'defaults': dict((k, str(v)) for k, v in note_data_defaults.items() if v is not None)
@@ -205,55 +271,125 @@ Frequency: {{frequency}}
                      'tier{t}'.format(t=t), timestamp] + tags
         }
 
-    def change_deck(self, type_, tier, note_ids):
+    def _upsert_notes(self, type_, notes, batch_size=None):
+        """
+        Upsert notes grouped by their target deck, which is known from the tags they are built with,
+        so that each deck gets a single change_deck call.
+
+        :param batch_size: if given, notes are consumed and committed batch_size at a time
+        """
+        from ankisync import anki_db
+
+        for chunk in (chunks(notes, batch_size) if batch_size else [notes]):
+            by_deck = dict()
+            for note in chunk:
+                by_deck.setdefault(self.deck_name(type_, note['tags']), []).append(note)
+
+            with anki_db.database.atomic():
+                for deck_name, deck_notes in by_deck.items():
+                    note_ids = self.anki.upsert_notes(deck_notes)
+                    if deck_name:
+                        self._move_notes(note_ids, deck_name)
+
+    @classmethod
+    def deck_name(cls, type_, tags):
+        """Deck for a note of type_ with tags, or None to leave it in the default deck."""
+        if type_.lower() not in tags:
+            return None
+
+        if type_ == 'Vocab':
+            levels = [lv for lv in range(1, 7) if f'HSK_Level_{lv}' in tags]
+            if levels:
+                return f'Chinese::{type_}::HSK{levels[-1]}'
+
+        if all('HSK' not in t for t in tags):
+            tiers = [tier for tier in range(1, 7) if f'tier{tier}' in tags]
+            if tiers:
+                return f'Chinese::{type_}::tier{tiers[-1]}'
+
+        return None
+
+    def _move_notes(self, note_ids, deck_name):
         card_forward = set()
         card_reverse = set()
         for note_id in note_ids:
-            search_result = self.anki.search_notes({'_nid': note_id})
-            tags = search_result[0]['_tags']
-            if type_.lower() in tags and f'tier{tier}' in tags and all('HSK' not in t for t in tags):
-                card_forward.add(self.anki.note_to_cards(note_id)['Forward'])
-                card_reverse.add(self.anki.note_to_cards(note_id)['Reverse'])
+            cards = self.anki.note_to_cards(note_id)
+            card_forward.add(cards['Forward'])
+            card_reverse.add(cards['Reverse'])
+
+        dconf_id = self._get_dconf_id()
+        self.anki.change_deck(card_forward, f'{deck_name}::zh->en', dconf=dconf_id)
+        self.anki.change_deck(card_reverse, f'{deck_name}::en->zh', dconf=dconf_id)
 
+    def _get_dconf_id(self):
         try:
-            dconf_id = self.anki.deck_config_names_and_ids()[self.DECK_CONFIG]
+            return self.anki.deck_config_names_and_ids()[self.DECK_CONFIG]
         except KeyError:
-            dconf_id = self.anki.save_deck_config(get_wanki_min_dconf())
+            return self.anki.save_deck_config(get_wanki_min_dconf())
 
-        self.anki.change_deck(card_forward, f'Chinese::{type_}::tier{tier}::zh->en', dconf=dconf_id)
-        self.anki.change_deck(card_reverse, f'Chinese::{type_}::tier{tier}::en->zh', dconf=dconf_id)
+    def change_deck(self, type_, tier, note_ids):
+        matched = []
+        for note_id in note_ids:
+            search_result = self.anki.search_notes({'_nid': note_id})
+            tags = search_result[0]['_tags']
+            if type_.lower() in tags and f'tier{tier}' in tags and all('HSK' not in t for t in tags):
+                matched.append(note_id)
+
+        self._move_notes(matched, f'Chinese::{type_}::tier{tier}')
 
     def change_deck_hsk(self, lv, note_ids):
         type_ = 'Vocab'
 
-        card_forward = set()
-        card_reverse = set()
+        matched = []
         for note_id in note_ids:
             search_result = self.anki.search_notes({'_nid': note_id})
             tags = search_result[0]['_tags']
             if type_.lower() in tags and f'HSK_Level_{lv}' in tags:
-                card_forward.add(self.anki.note_to_cards(note_id)['Forward'])
-                card_reverse.add(self.anki.note_to_cards(note_id)['Reverse'])
+                matched.append(note_id)
+
+        self._move_notes(matched, f'Chinese::{type_}::HSK{lv}')
+
+
+def _to_ref(item):
+    """Picklable stand-in for a model instance, to be sent to a note building worker"""
+    if isinstance(item, zh.BaseModel):
+        return item.id
+
+    return item
 
-        try:
-            dconf_id = self.anki.deck_config_names_and_ids()[self.DECK_CONFIG]
-        except KeyError:
-            dconf_id = self.anki.save_deck_config(get_wanki_min_dconf())
 
-        self.anki.change_deck(card_forward, f'Chinese::{type_}::HSK{lv}::zh->en', dconf=dconf_id)
-        self.anki.change_deck(card_reverse, f'Chinese::{type_}::HSK{lv}::en->zh', dconf=dconf_id)
+def _init_worker(config):
+    zh.configure(**config)
+
+
+def _build_notes_worker(args):
+    type_, refs = args
+    if type_ == 'Hanzi':
+        model, build_note = zh.Hanzi, AnkiExporter._build_hanzi_note
+    else:
+        model, build_note = zh.Vocab, AnkiExporter._build_vocab_note
+
+    ids = [ref for ref in refs if isinstance(ref, int)]
+    db_items = dict((m.id, m) for m in model.select().where(model.id.in_(ids)))
+
+    return [build_note(db_items[ref] if isinstance(ref, int) else ref) for ref in refs]
 
 
 class SimpleSrsExporter:
     def __init__(self, filename):
+        import simplesrs as srs
+
         srs.init(filename)
 
     @classmethod
     def add_hanzi(cls, hanzi):
+        import simplesrs as srs
+
         timestamp = datetime.now().strftime('%Y-%m-%d')
 
         try:
             db_hanzi = zh.Hanzi.get_or_none(hanzi=hanzi)
+            tier = HanziLevel.get_level_from_junda(zh.get_junda_table().get(hanzi))[1]
             info = dict()
             tags = []
             if db_hanzi:
@@ -263,7 +399,7 @@ class SimpleSrsExporter:
                     item='Hanzi meaning: {}'.format(db_hanzi.meaning),
                     info=info,
                     tags=(['zhlib', 'hanzi', 'en->zh',
-                           'tier{t}'.format(t=HanziLevel.get_level(hanzi)[1]),
+                           'tier{t}'.format(t=tier),
                            timestamp] + tags)
                 )
 
@@ -271,7 +407,7 @@ class SimpleSrsExporter:
                 item='Hanzi: {}'.format(hanzi),
                 info=info,
                 tags=(['zhlib', 'hanzi', 'zh->en',
-                       'tier{t}'.format(t=HanziLevel.get_level(hanzi)[1]),
+                       'tier{t}'.format(t=tier),
                        timestamp] + tags)
             )
         except peewee.IntegrityError:
@@ -279,10 +415,13 @@ class SimpleSrsExporter:
 
     @classmethod
     def add_vocab(cls, vocab):
+        import simplesrs as srs
+
         timestamp = datetime.now().strftime('%Y-%m-%d')
 
         try:
             db_vocabs = zh.Vocab.match(vocab)
+            tier = HanziLevel.get_level_from_junda(zh.get_junda_table().get(vocab))[1]
             info = dict()
             tags = list()
             if len(db_vocabs) > 0:
@@ -292,7 +431,7 @@ class SimpleSrsExporter:
                     item='Vocab meaning: {}'.format(db_vocabs[0].english),
                     info=info,
                     tags=(['zhlib', 'vocab', 'en->zh',
-                           'tier{t}'.format(t=HanziLevel.get_level(vocab)[1]),
+                           'tier{t}'.format(t=tier),
                            timestamp] + tags)
                 )
 
@@ -300,7 +439,7 @@ class SimpleSrsExporter:
                 item='Vocab: {}'.format(vocab),
                 info=info,
                 tags=(['zhlib', 'vocab', 'zh->en',
-                       'tier{t}'.format(t=HanziLevel.get_level(vocab)[1]),
+                       'tier{t}'.format(t=tier),
                        timestamp] + tags)
             )
         except peewee.IntegrityError:
@@ -1,26 +1,101 @@
-from wordfreq import word_frequency
+import os
 import math
+import hashlib
+from collections import Counter
 
 from . import zh
-from .util import find_hanzi, find_vocab
+from .util import RE_IS_HAN, is_han, word_frequency, chunks, sentence_chunks
+
+# Characters per chunk segmented by StreamingLevel
+STREAM_CHUNK_SIZE = 100000
+
+
+class TextAnalysis:
+    """
+    Hanzi and vocab of a text, each with its number of occurrences in the text.
+    The text is segmented once, on first use; tiers are computed when first asked for.
+    Pass it instead of the text to Level, HanziLevel, VocabLevel and the exporters, so that they share it.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self._hanzi = None
+        self._vocab = None
+        self._hanzi_levels = None
+        self._vocab_levels = None
+
+    @classmethod
+    def of(cls, text):
+        """:return: text itself if it is already a TextAnalysis"""
+        if isinstance(text, cls):
+            return text
+
+        return cls(text)
+
+    @classmethod
+    def from_counts(cls, text='', hanzi=None, vocab=None):
+        """A TextAnalysis of already segmented text"""
+        analysis = cls(text)
+        analysis._hanzi = Counter(hanzi or ())
+        analysis._vocab = Counter(vocab or ())
+
+        return analysis
+
+    @property
+    def hanzi(self):
+        """Counter of hanzi, in order of first occurrence"""
+        if self._hanzi is None:
+            self._hanzi = Counter(RE_IS_HAN.findall(self.text))
+
+        return self._hanzi
+
+    @property
+    def vocab(self):
+        """Counter of vocab, as segmented by jieba.cut_for_search, in order of first occurrence"""
+        if self._vocab is None:
+            import jieba
+
+            self._vocab = Counter(v for v in jieba.cut_for_search(self.text) if is_han(v))
+
+        return self._vocab
+
+    @property
+    def hanzi_levels(self):
+        """``{hanzi: (junda, tier)}``, see HanziLevel.get_level"""
+        if self._hanzi_levels is None:
+            table = zh.get_junda_table()
+            self._hanzi_levels = dict((h, HanziLevel.get_level_from_junda(table.get(h))) for h in self.hanzi)
+
+        return self._hanzi_levels
+
+    @property
+    def vocab_levels(self):
+        """``{vocab: (frequency, tier)}``, see VocabLevel.get_level"""
+        if self._vocab_levels is None:
+            self._vocab_levels = dict((v, VocabLevel.get_level(v)) for v in self.vocab)
+
+        return self._vocab_levels
 
 
 class Level:
     TIER_MIN = 1
     TIER_MAX = 6
 
-    def __init__(self, text, jsonify=True):
-        self.text = text
+    def __init__(self, text, jsonify=True, snapshot=None):
+        """:param text: str, or TextAnalysis"""
+        self.analysis = TextAnalysis.of(text)
+        self.text = self.analysis.text
         self.jsonify = jsonify
+        self.snapshot = snapshot
 
     @property
     def hanzi(self):
-        return sorted(HanziLevel(self.text, jsonify=self.jsonify),
+        return sorted(HanziLevel(self.analysis, jsonify=self.jsonify, snapshot=self.snapshot),
                       key=lambda x: x[0] if x[0] else math.inf)
 
     @property
     def vocab(self):
-        return sorted(VocabLevel(self.text, jsonify=self.jsonify),
+        return sorted(VocabLevel(self.analysis, jsonify=self.jsonify, snapshot=self.snapshot),
                       key=lambda x: -x[0])
 
     @classmethod
@@ -35,12 +110,55 @@ class Level:
 
 
 class HanziLevel:
-    def __init__(self, text, jsonify=True):
-        self.text = text
+    def __init__(self, text, jsonify=True, batched=True, snapshot=None):
+        """
+        :param batched: resolve all hanzi of the text with a few chunked ``IN (...)`` queries,
+        instead of querying the database once per hanzi
+        :param snapshot: zhlib.snapshot.Snapshot to look hanzi up in, instead of the database
+        """
+        self.analysis = TextAnalysis.of(text)
+        self.text = self.analysis.text
         self.jsonify = jsonify
+        self.batched = batched
+        self.snapshot = snapshot
 
     def __iter__(self):
-        for hanzi in find_hanzi(self.text):
+        if self.snapshot is not None:
+            yield from self._iter_snapshot()
+            return
+
+        if not self.batched:
+            yield from self._iter_each()
+            return
+
+        for chunk in chunks(self.analysis.hanzi, zh.CHUNK_SIZE):
+            db_hanzis = zh.Hanzi.get_many(chunk)
+            if self.jsonify:
+                json_hanzis = dict(zip(db_hanzis.keys(), zh.Hanzi.to_json_many(db_hanzis.values())))
+
+            for hanzi in chunk:
+                db_hanzi = db_hanzis.get(hanzi)
+                if db_hanzi:
+                    level, tier = self.get_level_from_junda(db_hanzi.junda)
+                    if self.jsonify:
+                        yield level, tier, json_hanzis[hanzi]
+                    else:
+                        yield level, tier, db_hanzi
+                else:
+                    level, tier = self.get_level_from_junda(None)
+                    yield level, tier, dict(hanzi=hanzi)
+
+    def _iter_snapshot(self):
+        for hanzi in self.analysis.hanzi:
+            level, tier = self.snapshot.get_level(hanzi)
+            record = self.snapshot.get_hanzi(hanzi)
+            if record:
+                yield level, tier, (record.to_json() if self.jsonify else record)
+            else:
+                yield level, tier, dict(hanzi=hanzi)
+
+    def _iter_each(self):
+        for hanzi in self.analysis.hanzi:
             level, tier = self.get_level(hanzi)
             db_hanzi = zh.Hanzi.get_or_none(hanzi=hanzi)
             if db_hanzi:
@@ -52,16 +170,15 @@ class HanziLevel:
                 yield level, tier, dict(hanzi=hanzi)
 
     def __len__(self):
-        return len(find_hanzi(self.text))
+        return len(self.analysis.hanzi)
 
     @classmethod
     def get_level(cls, hanzi):
-        db_hanzi = zh.Hanzi.get_or_none(hanzi=hanzi)
-        if db_hanzi:
-            level = db_hanzi.junda
-        else:
-            level = None
+        """Junda and tier of hanzi, without checking whether the database has changed, see zh.get_junda_table"""
+        return cls.get_level_from_junda(zh.get_junda_table(check=False).get(hanzi))
 
+    @classmethod
+    def get_level_from_junda(cls, level):
         if level:
             return level, Level.normalize(level // 400 + 1)
 
@@ -71,12 +188,55 @@ class HanziLevel:
 class VocabLevel:
     FREQ_FACTOR = 10 ** 6
 
-    def __init__(self, text, jsonify=True):
-        self.text = text
+    def __init__(self, text, jsonify=True, batched=True, snapshot=None):
+        """
+        :param batched: resolve all vocab of the text with a few chunked ``IN (...)`` queries,
+        instead of querying the database once per vocab
+        :param snapshot: zhlib.snapshot.Snapshot to look vocab up in, instead of the database
+        """
+        self.analysis = TextAnalysis.of(text)
+        self.text = self.analysis.text
         self.jsonify = jsonify
+        self.batched = batched
+        self.snapshot = snapshot
 
     def __iter__(self):
-        for vocab in find_vocab(self.text):
+        if self.snapshot is not None:
+            yield from self._iter_snapshot()
+            return
+
+        if not self.batched:
+            yield from self._iter_each()
+            return
+
+        for chunk in chunks(self.analysis.vocab, zh.CHUNK_SIZE):
+            db_vocabs = zh.Vocab.match_many(chunk)
+            if self.jsonify:
+                json_vocabs = dict(zip(db_vocabs.keys(), zh.Vocab.to_json_many(db_vocabs.values())))
+
+            for vocab in chunk:
+                freq, tier = self.analysis.vocab_levels[vocab]
+
+                db_vocab = db_vocabs.get(vocab)
+                if db_vocab:
+                    if self.jsonify:
+                        yield freq, tier, json_vocabs[vocab]
+                    else:
+                        yield freq, tier, db_vocab
+                else:
+                    yield freq, tier, dict(simplified=vocab)
+
+    def _iter_snapshot(self):
+        for vocab in self.analysis.vocab:
+            freq, tier = self.analysis.vocab_levels[vocab]
+            record = self.snapshot.match(vocab)
+            if record:
+                yield freq, tier, (record.to_json() if self.jsonify else record)
+            else:
+                yield freq, tier, dict(simplified=vocab)
+
+    def _iter_each(self):
+        for vocab in self.analysis.vocab:
             freq, tier = self.get_level(vocab)
 
             db_vocab = zh.Vocab.match(vocab)
@@ -86,10 +246,10 @@ class VocabLevel:
                 else:
                     yield freq, tier, db_vocab[0]
             else:
-               yield freq, tier, dict(simplified=vocab)
+                yield freq, tier, dict(simplified=vocab)
 
     def __len__(self):
-        return len(find_vocab(self.text))
+        return len(self.analysis.vocab)
 
     @classmethod
     def get_level(cls, vocab):
@@ -98,3 +258,126 @@ class VocabLevel:
             return freq, Level.normalize(7 - math.ceil(math.log10(freq) * 2))
         except ValueError:
             return freq, Level.TIER_MAX
+
+
+class _RunningLevel:
+    """Level items of a running TextAnalysis, each hanzi and vocab being looked up once"""
+
+    def __init__(self, jsonify=True, snapshot=None):
+        self.jsonify = jsonify
+        self.snapshot = snapshot
+        self.analysis = TextAnalysis.from_counts()
+        self._hanzi = dict()
+        self._vocab = dict()
+
+    def _add(self, analysis, n=1):
+        """Add n times the counts of analysis, dropping the items whose counts reach zero"""
+        for counter, other, items in [(self.analysis.hanzi, analysis.hanzi, self._hanzi),
+                                      (self.analysis.vocab, analysis.vocab, self._vocab)]:
+            for k, count in other.items():
+                counter[k] += count * n
+                if counter[k] <= 0:
+                    del counter[k]
+                    items.pop(k, None)
+
+        self.analysis._hanzi_levels = self.analysis._vocab_levels = None
+
+    def _lookup_new(self):
+        new_hanzi = [h for h in self.analysis.hanzi if h not in self._hanzi]
+        self._hanzi.update(zip(new_hanzi, HanziLevel(TextAnalysis.from_counts(hanzi=new_hanzi),
+                                                     jsonify=self.jsonify, snapshot=self.snapshot)))
+        new_vocab = [v for v in self.analysis.vocab if v not in self._vocab]
+        self._vocab.update(zip(new_vocab, VocabLevel(TextAnalysis.from_counts(vocab=new_vocab),
+                                                     jsonify=self.jsonify, snapshot=self.snapshot)))
+
+    @property
+    def hanzi(self):
+        return sorted(self._hanzi.values(), key=lambda x: x[0] if x[0] else math.inf)
+
+    @property
+    def vocab(self):
+        return sorted(self._vocab.values(), key=lambda x: -x[0])
+
+
+class IncrementalLevel(_RunningLevel):
+    """
+    Level of a document that is re-analyzed after every edit.
+
+        level = IncrementalLevel()
+        level.update(text)
+        level.hanzi, level.vocab    # As Level(text).hanzi and Level(text).vocab, up to the order of ties
+        level.update(edited_text)   # Only segments the lines that changed
+
+    Every line is segmented once and kept by content hash, while it is in the document;
+    every hanzi and vocab is looked up once, while it is in the document.
+    """
+
+    def __init__(self, jsonify=True, snapshot=None):
+        super().__init__(jsonify=jsonify, snapshot=snapshot)
+        self._lines = Counter()
+        self._line_analyses = dict()
+
+    def update(self, text):
+        lines = Counter()
+        for line in text.split('\n'):
+            key = hashlib.blake2b(line.encode('utf8'), digest_size=16).digest()
+            lines[key] += 1
+            if key not in self._line_analyses:
+                self._line_analyses[key] = TextAnalysis(line)
+
+        for key, n in (lines - self._lines).items():
+            self._add(self._line_analyses[key], n)
+
+        for key, n in (self._lines - lines).items():
+            self._add(self._line_analyses[key], -n)
+            if key not in lines:
+                del self._line_analyses[key]
+
+        self._lines = lines
+        self.analysis.text = text
+        self._lookup_new()
+
+        return self
+
+
+class StreamingLevel(_RunningLevel):
+    """
+    Level of a corpus read line by line, e.g. one that does not fit in memory.
+
+        level = StreamingLevel('corpus.txt')
+        for analysis in level:      # After every chunk of about chunk_size characters
+            print(len(analysis.vocab), level.vocab[:10])
+
+    The text is segmented in chunks ending on sentence boundaries, which jieba does not segment across.
+    Memory grows with the number of distinct hanzi and vocab, not with the size of the corpus.
+    """
+
+    def __init__(self, source, jsonify=True, snapshot=None, chunk_size=STREAM_CHUNK_SIZE, encoding='utf8'):
+        """:param source: path of a text file, or an iterable of lines"""
+        super().__init__(jsonify=jsonify, snapshot=snapshot)
+        self.source = source
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+
+    def __iter__(self):
+        """:return: the running TextAnalysis, whose text is the chunk last added, after every chunk"""
+        if isinstance(self.source, (str, os.PathLike)):
+            with open(self.source, encoding=self.encoding) as f:
+                yield from self._iter_lines(f)
+        else:
+            yield from self._iter_lines(self.source)
+
+    def _iter_lines(self, lines):
+        for chunk in sentence_chunks(lines, self.chunk_size):
+            self._add(TextAnalysis(chunk))
+            self.analysis.text = chunk
+            self._lookup_new()
+
+            yield self.analysis
+
+    def run(self):
+        """Read the whole source, and return self"""
+        for _ in self:
+            pass
+
+        return self
@@ -0,0 +1,246 @@
+"""
+Bulk loading of dict.db, from CEDICT-style, Junda-style and sentence TSV files.
+
+Rows are written with insert_many in large transactions. Model.save() is never called,
+so the post_save signals of zh do not fire; the relations they would compute are built in memory
+by :meth:`BulkLoader.link` and bulk-inserted afterwards, and an existing n-gram index is
+brought up to date by zh.update_ngram_index().
+
+    python -m zhlib.loader dict.db --junda junda.txt --cedict cedict_ts.u8 --sentences sentences.tsv
+    python -m zhlib.loader dict.db --relink --processes 16
+"""
+import argparse
+import multiprocessing
+import re
+
+import peewee as pv
+
+from . import zh
+from .util import find_hanzi, find_vocab, word_frequency, chunks, progress_bar
+
+TABLES = [
+    zh.Tag, zh.Hanzi, zh.Vocab, zh.Sentence,
+    zh.HanziTag, zh.VocabTag, zh.SentenceTag,
+    zh.VocabHanzi, zh.SentenceHanzi, zh.SentenceVocab
+]
+
+TOKENIZE_CHUNK_SIZE = 1000
+
+RE_CEDICT = re.compile(r'^(\S+) (\S+) \[([^\]]*)\] /(.*)/$')
+
+
+def read_cedict(filename):
+    """``Traditional Simplified [pin1 yin1] /english 1/english 2/``, one entry per line"""
+    with open(filename, encoding='utf8') as f:
+        for row in f:
+            row = row.strip()
+            if not row or row.startswith('#'):
+                continue
+
+            m = RE_CEDICT.match(row)
+            if m:
+                traditional, simplified, pinyin, english = m.groups()
+                yield dict(
+                    simplified=simplified,
+                    traditional=traditional if traditional != simplified else None,
+                    pinyin=pinyin,
+                    english=english
+                )
+
+
+def read_junda(filename):
+    """``rank<TAB>hanzi<TAB>count<TAB>percentile[<TAB>pinyin[<TAB>meaning]]``, as in migration/junda.txt"""
+    with open(filename, encoding='utf8') as f:
+        for row in f:
+            row = row.rstrip('\n').split('\t')
+            if len(row) >= 2:
+                yield dict(
+                    junda=int(row[0]),
+                    hanzi=row[1],
+                    pinyin=row[4] if len(row) > 4 and row[4] else None,
+                    meaning=row[5] if len(row) > 5 and row[5] else None
+                )
+
+
+def read_sentences(filename):
+    """``sentence[<TAB>pinyin[<TAB>english]]``; the line number becomes Sentence.order"""
+    with open(filename, encoding='utf8') as f:
+        for i, row in enumerate(f):
+            row = row.rstrip('\n').split('\t')
+            if row[0]:
+                yield dict(
+                    sentence=row[0],
+                    pinyin=row[1] if len(row) > 1 and row[1] else None,
+                    english=row[2] if len(row) > 2 and row[2] else None,
+                    order=i
+                )
+
+
+def tokenize_sentence(sentence):
+    """
+    :return: hanzi and vocab found in a sentence, which is the work sentence_post_save used to do
+    """
+    return find_hanzi(sentence), find_vocab(sentence)
+
+
+class BulkLoader:
+    def __init__(self, database=zh.database):
+        self.database = database
+
+    def create_tables(self):
+        self.database.create_tables(TABLES)
+
+    def insert_many(self, model, rows, on_conflict=None):
+        """Model.insert_many in one transaction, chunked to stay under SQLite's variable limit"""
+        rows = list(rows)
+        if not rows:
+            return
+
+        batch_size = max(1, zh.CHUNK_SIZE * 2 // len(rows[0]))
+        with self.database.atomic():
+            for chunk in chunks(rows, batch_size):
+                query = model.insert_many(chunk)
+                if on_conflict is None:
+                    query = query.on_conflict_ignore()
+                else:
+                    query = query.on_conflict(**on_conflict)
+
+                query.execute()
+
+    def load_hanzi(self, rows):
+        """Insert hanzi, or fill junda (and missing pinyin / meaning) of existing ones"""
+        self.insert_many(zh.Hanzi, rows, on_conflict=dict(
+            conflict_target=[zh.Hanzi.hanzi],
+            update={
+                zh.Hanzi.junda: pv.EXCLUDED.junda,
+                zh.Hanzi.pinyin: pv.fn.COALESCE(zh.Hanzi.pinyin, pv.EXCLUDED.pinyin),
+                zh.Hanzi.meaning: pv.fn.COALESCE(zh.Hanzi.meaning, pv.EXCLUDED.meaning)
+            }
+        ))
+        zh.get_junda_table.cache_clear()
+
+    def load_vocab(self, rows):
+        self.insert_many(zh.Vocab, (
+            dict(row, frequency=word_frequency(row['simplified'], 'zh')) for row in rows
+        ))
+        zh.update_ngram_index()
+
+    def load_sentences(self, rows):
+        self.insert_many(zh.Sentence, rows)
+        zh.update_ngram_index()
+
+    def link(self, processes=None):
+        """
+        Compute VocabHanzi, SentenceHanzi and SentenceVocab in memory, then bulk-insert them.
+        Hanzi and vocab that are only found in vocab or sentences are created, as the signals did.
+
+        :param processes: if given, sentences are segmented by jieba over a pool of that many processes
+        """
+        rows = list(zh.Sentence.select(zh.Sentence.id, zh.Sentence.sentence).tuples())
+        sentence_ids = [sentence_id for sentence_id, _ in rows]
+        sentences = [sentence for _, sentence in rows]
+
+        if processes:
+            # Spawned, not forked, so that no worker inherits this process's SQLite connection,
+            # which relink() holds in the middle of a write transaction.
+            with multiprocessing.get_context('spawn').Pool(processes) as pool:
+                tokens = list(progress_bar(pool.imap(tokenize_sentence, sentences, chunksize=TOKENIZE_CHUNK_SIZE),
+                                           total=len(sentences), desc='Tokenizing sentences'))
+        else:
+            tokens = [tokenize_sentence(sentence)
+                      for sentence in progress_bar(sentences, desc='Tokenizing sentences')]
+
+        self.link_tokens(list(zip(sentence_ids, tokens)))
+
+    def relink(self, processes=None):
+        """Drop and rebuild all VocabHanzi, SentenceHanzi and SentenceVocab rows, in one transaction"""
+        with self.database.atomic():
+            for model in (zh.VocabHanzi, zh.SentenceHanzi, zh.SentenceVocab):
+                model.delete().execute()
+
+            self.link(processes=processes)
+
+    def link_tokens(self, tokens):
+        """
+        :param tokens: ``[(sentence_id, (hanzi set, vocab set))]``, see :func:`tokenize_sentence`
+        """
+        vocab_ids = self._vocab_ids()
+        missing = set().union(*(v for _, (_, v) in tokens)) - set(vocab_ids.keys())
+        self.load_vocab(dict(simplified=v) for v in sorted(missing))
+        vocab_ids = self._vocab_ids()
+
+        vocab_hanzis = [
+            (vocab_id, find_hanzi(simplified + (traditional or '')))
+            for vocab_id, simplified, traditional
+            in zh.Vocab.select(zh.Vocab.id, zh.Vocab.simplified, zh.Vocab.traditional).tuples()
+        ]
+
+        hanzi_ids = dict(zh.Hanzi.select(zh.Hanzi.hanzi, zh.Hanzi.id).tuples())
+        missing = set().union(*(h for _, h in vocab_hanzis), *(h for _, (h, _) in tokens)) - set(hanzi_ids.keys())
+        self.insert_many(zh.Hanzi, (dict(hanzi=h) for h in sorted(missing)))
+        hanzi_ids = dict(zh.Hanzi.select(zh.Hanzi.hanzi, zh.Hanzi.id).tuples())
+
+        self.insert_many(zh.VocabHanzi, (
+            dict(vocab=vocab_id, hanzi=hanzi_ids[h])
+            for vocab_id, hanzis in vocab_hanzis for h in hanzis
+        ))
+        self.insert_many(zh.SentenceHanzi, (
+            dict(sentence=sentence_id, hanzi=hanzi_ids[h])
+            for sentence_id, (hanzis, _) in tokens for h in hanzis
+        ))
+        self.insert_many(zh.SentenceVocab, (
+            dict(sentence=sentence_id, vocab=vocab_ids[v])
+            for sentence_id, (_, vocabs) in tokens for v in vocabs
+        ))
+
+    @staticmethod
+    def _vocab_ids():
+        """Same as Vocab.match(v)[0].id, for every v at once"""
+        vocab_ids = dict()
+        query = zh.Vocab.select(zh.Vocab.id, zh.Vocab.simplified, zh.Vocab.traditional).order_by(zh.Vocab.id)
+        for vocab_id, simplified, traditional in query.tuples():
+            vocab_ids.setdefault(simplified, vocab_id)
+            if traditional:
+                vocab_ids.setdefault(traditional, vocab_id)
+
+        return vocab_ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build dict.db from dictionary files.')
+    parser.add_argument('database', help='SQLite file to create or update')
+    parser.add_argument('--junda', help='Junda-style hanzi frequency list, e.g. migration/junda.txt')
+    parser.add_argument('--cedict', help='CEDICT-style vocab list')
+    parser.add_argument('--sentences', help='TSV of sentence, pinyin, english')
+    parser.add_argument('--no-link', action='store_true', help='skip building relation tables')
+    parser.add_argument('--no-index', action='store_true', help='skip building the n-gram index')
+    parser.add_argument('--no-radicals', action='store_true', help='skip precomputing hanzi radicals')
+    parser.add_argument('--relink', action='store_true', help='rebuild relation tables from scratch')
+    parser.add_argument('--processes', type=int, help='segment sentences over this many processes')
+    args = parser.parse_args(argv)
+
+    zh.configure(args.database, immutable=False)
+
+    with zh.writable():
+        loader = BulkLoader()
+        loader.create_tables()
+        if args.junda:
+            loader.load_hanzi(read_junda(args.junda))
+        if args.cedict:
+            loader.load_vocab(read_cedict(args.cedict))
+        if args.sentences:
+            loader.load_sentences(read_sentences(args.sentences))
+        if args.relink:
+            loader.relink(processes=args.processes)
+        elif not args.no_link:
+            loader.link(processes=args.processes)
+        if not args.no_index:
+            zh.build_ngram_index()
+            zh.build_link_indexes()
+        if not args.no_radicals:
+            zh.build_radical_table()
+            zh.build_component_index()
+
+
+if __name__ == '__main__':
+    main()
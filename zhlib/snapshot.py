@@ -0,0 +1,109 @@
+"""
+Read-only, in-process copy of Hanzi and Vocab, for exact-match lookups without SQLite or peewee.
+
+    snapshot = Snapshot.build()
+    snapshot.get_hanzi('中').to_json() == zh.Hanzi.get(hanzi='中').to_json()
+    snapshot.match('中國').to_json() == zh.Vocab.match('中國')[0].to_json()
+
+Records are plain ``__slots__`` objects, indexed by dicts on hanzi, simplified and traditional.
+The related lists of to_json (vocabs, sentences, tags) are computed once, by :meth:`Snapshot.build`.
+"""
+from . import zh
+from .util import chunks
+
+
+class _Record:
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        for k in self.__slots__:
+            setattr(self, k, kwargs.get(k))
+
+    def __getitem__(self, item):
+        return getattr(self, item)
+
+    def __iter__(self):
+        return iter(self.to_json().items())
+
+    def to_json(self):
+        """Same dict as the to_json of the model it was taken from"""
+        return dict((k, list(v) if isinstance(v, tuple) else v) for k, v in self._json_items())
+
+    def _json_items(self):
+        return ((k, getattr(self, k)) for k in self.__slots__)
+
+
+class HanziRecord(_Record):
+    __slots__ = ('id', 'hanzi', 'pinyin', 'meaning', 'heisig', 'kanji', 'junda',
+                 'vocabs', 'sentences', 'tags')
+
+    __str__ = zh.Hanzi.__str__
+
+
+class VocabRecord(_Record):
+    __slots__ = ('id', 'simplified', 'traditional', 'pinyin', 'english',
+                 'sentences', 'tags', 'frequency')
+
+    __str__ = zh.Vocab.__str__
+
+    def _json_items(self):
+        # frequency is not part of Vocab.to_json
+        return ((k, getattr(self, k)) for k in self.__slots__ if k != 'frequency')
+
+
+class Snapshot:
+    def __init__(self, hanzis=(), vocabs=()):
+        """
+        :param hanzis: HanziRecord's
+        :param vocabs: VocabRecord's, in id order; as with Vocab.match_many, the first one matching wins
+        """
+        self.hanzis = dict((h.hanzi, h) for h in hanzis)
+        self.vocabs = dict()
+        for v in vocabs:
+            self.vocabs.setdefault(v.simplified, v)
+            if v.traditional:
+                self.vocabs.setdefault(v.traditional, v)
+
+    @classmethod
+    def build(cls, related=True, chunk_size=zh.CHUNK_SIZE):
+        """
+        :param related: also fill vocabs, sentences and tags, with to_json_many over the whole database
+        (bypassing zh.json_cache, which it would only flush).
+        If False, building is much quicker, but those lists are left empty.
+        """
+        return cls(
+            hanzis=cls._load(zh.Hanzi, HanziRecord, related, chunk_size),
+            vocabs=cls._load(zh.Vocab, VocabRecord, related, chunk_size)
+        )
+
+    @staticmethod
+    def _load(model, record_class, related, chunk_size):
+        fields = [f for f in model._meta.sorted_fields if f.name in record_class.__slots__]
+        query = model.select(*fields).order_by(model.id)
+
+        if not related:
+            for row in query.dicts().iterator():
+                yield record_class(**row, **dict((k, ()) for k in ('vocabs', 'sentences', 'tags')))
+            return
+
+        for chunk in chunks(query.iterator(), chunk_size):
+            for db_model, d in zip(chunk, model._to_json_many(chunk)):
+                yield record_class(**dict(
+                    ((k, tuple(v) if isinstance(v, list) else v) for k, v in d.items()),
+                    frequency=getattr(db_model, 'frequency', None)
+                ))
+
+    def get_hanzi(self, hanzi):
+        """:return: HanziRecord, or None"""
+        return self.hanzis.get(hanzi)
+
+    def match(self, vocab):
+        """:return: VocabRecord of the first Vocab.match, or None"""
+        return self.vocabs.get(vocab)
+
+    def get_level(self, hanzi):
+        """Same as HanziLevel.get_level"""
+        from .level import HanziLevel
+
+        db_hanzi = self.hanzis.get(hanzi)
+        return HanziLevel.get_level_from_junda(db_hanzi.junda if db_hanzi else None)
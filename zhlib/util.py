@@ -1,8 +1,18 @@
+import os
+import json
 import regex
-import jieba
-from wordfreq import word_frequency
+import heapq
+import string
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
 
 RE_IS_HAN = regex.compile(r'\p{IsHan}')
+RE_SENTENCE_END = regex.compile(r'(?<=[。！？!?；;\n])')
+FREQUENCY_CACHE_SIZE = 2 ** 18
+GRAM_SIZE = 2
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
 
 
 def is_han(s):
@@ -14,16 +24,177 @@ def find_hanzi(s):
 
 
 def find_vocab(s):
+    import jieba
+
     return set(v for v in jieba.cut_for_search(s) if is_han(v))
 
 
+def word_frequency(word, lang='zh'):
+    """wordfreq.word_frequency, memoized in frequency_cache, with wordfreq only imported on first use"""
+    key = (word, lang)
+    freq = frequency_cache.get(key)
+    if freq is None:
+        from wordfreq import word_frequency as _word_frequency
+
+        freq = frequency_cache[key] = _word_frequency(word, lang)
+
+    return freq
+
+
+def wordfreq_version():
+    from importlib.metadata import version
+
+    return version('wordfreq')
+
+
+def save_frequency_cache(path):
+    """Write frequency_cache to a JSON file, for load_frequency_cache to read in another process"""
+    with open(path, 'w', encoding='utf8') as f:
+        json.dump({
+            'wordfreq': wordfreq_version(),
+            'frequency': [[word, lang, freq] for (word, lang), freq in frequency_cache.items()]
+        }, f, ensure_ascii=False)
+
+
+def load_frequency_cache(path):
+    """
+    Fill frequency_cache from a file written by save_frequency_cache.
+
+    :return: False if there is no such file, or if it was written with another version of wordfreq
+    """
+    if not os.path.exists(path):
+        return False
+
+    with open(path, encoding='utf8') as f:
+        d = json.load(f)
+
+    if d.get('wordfreq') != wordfreq_version():
+        return False
+
+    for word, lang, freq in d['frequency']:
+        frequency_cache[(word, lang)] = freq
+
+    return True
+
+
+def ascii_lower(s):
+    """Lowercase ASCII letters only, which is all the case folding SQLite's LIKE does"""
+    return s.translate(ASCII_LOWER)
+
+
+def ngrams(s, n=GRAM_SIZE):
+    """All substrings of ascii_lower(s), of length 1 to n"""
+    s = ascii_lower(s)
+    return set(s[i:i + k] for k in range(1, n + 1) for i in range(len(s) - k + 1))
+
+
 def sort_vocab(v_list, limit=None, key=lambda x: x):
-    result = sorted(v_list, key=lambda x: -word_frequency(getattr(key(x), 'simplified', x), 'zh'))
+    def _frequency(x):
+        v = key(x)
+        freq = getattr(v, 'frequency', None)
+        if freq is None:
+            freq = word_frequency(getattr(v, 'simplified', v), 'zh')
+
+        return freq
 
     if limit:
-        return result[:limit]
+        return heapq.nlargest(limit, v_list, key=_frequency)
+
+    return sorted(v_list, key=lambda x: -_frequency(x))
+
+
+def chunks(it, size):
+    it = iter(it)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+
+        yield chunk
+
+
+class LRUCache:
+    """Thread-safe mapping of at most maxsize entries, each kept for at most ttl seconds if given"""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+    def items(self):
+        """Unexpired entries, least recently used first"""
+        now = time.monotonic()
+        with self._lock:
+            return [(k, v) for k, (v, expires) in self._data.items() if expires is None or expires >= now]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        return dict(hits=self.hits, misses=self.misses, size=len(self), maxsize=self.maxsize, ttl=self.ttl)
+
+
+frequency_cache = LRUCache(FREQUENCY_CACHE_SIZE)
+
+
+def sentence_chunks(lines, size):
+    """
+    Join lines into chunks of about size characters, each ending at the end of a line or a sentence.
+    Lines longer than size are split after 。！？!?；; lines without a trailing newline get one,
+    so that nothing is segmented across them.
+    """
+    buffer = []
+    length = 0
+    for line in lines:
+        if not line.endswith('\n'):
+            line += '\n'
+
+        for part in (RE_SENTENCE_END.split(line) if len(line) > size else [line]):
+            if not part:
+                continue
+
+            buffer.append(part)
+            length += len(part)
+            if length >= size:
+                yield ''.join(buffer)
+                buffer = []
+                length = 0
 
-    return result
+    if buffer:
+        yield ''.join(buffer)
 
 
 def progress_bar(it, progress_func=lambda x, **kw: x, **kwargs):
@@ -1,15 +1,270 @@
+import os
+import copy
+import logging
+import sqlite3
+import threading
+import time
+from itertools import count
 import peewee as pv
 from playhouse import signals
+from playhouse.pool import PooledSqliteDatabase
 from playhouse.shortcuts import model_to_dict
 from pathlib import Path
-from cjkradlib import RadicalFinder
+from contextlib import contextmanager
+from collections import namedtuple
+from functools import reduce, lru_cache
+from operator import or_, add
+
+from .util import find_hanzi, find_vocab, word_frequency, chunks, ngrams, ascii_lower, GRAM_SIZE, LRUCache
+
+# Keep well below SQLITE_MAX_VARIABLE_NUMBER (999 on older builds).
+CHUNK_SIZE = 400
+# Number of per-item subqueries glued into one UNION ALL by the *_many methods.
+UNION_SIZE = 50
+RADICAL_CACHE_SIZE = 4096
+SEARCH_CACHE_SIZE = 1024
+JSON_CACHE_SIZE = 8192
+
+DEFAULT_PATH = str(Path(__file__).with_name('dict.db'))
+READ_PRAGMAS = {
+    'query_only': 'ON',
+    'mmap_size': 256 * 1024 ** 2,
+    'cache_size': -64 * 1024,   # In KiB, i.e. 64 MiB per connection
+    'temp_store': 'MEMORY'
+}
+
+database = pv.DatabaseProxy()
+_config = dict()
+# Callbacks clearing what is cached about the current database, run when it is reconfigured
+_on_configure = []
+_writable_depth = 0
+_memory = dict()
+_memory_ids = count()
+_radical_finder = None
+# database_identity() of the file the current connections were opened on
+_identity = dict()
+_identity_lock = threading.RLock()
+
+_table_exists = dict()
+_on_configure.append(_table_exists.clear)
+
+# Keyed on the database identity as well, so that results read before a change are not served after it
+search_cache = LRUCache(SEARCH_CACHE_SIZE)
+json_cache = LRUCache(JSON_CACHE_SIZE)
+_on_configure.extend([search_cache.clear, json_cache.clear])
+
+
+def configure(path=None, immutable=None, pooled=False, max_connections=32, pragmas=None, in_memory=False):
+    """
+    Point all models at a database. Connections are per thread (or drawn from a pool if pooled),
+    opened read-only with READ_PRAGMAS.
+
+    :param path: defaults to $ZHLIB_DATABASE, or the dict.db shipped in the package
+    :param immutable: open with ``immutable=1``, so that SQLite skips locking and change detection;
+    defaults to True for the shipped dict.db only. :func:`writable` lifts it temporarily.
+    :param pragmas: overrides of READ_PRAGMAS
+    :param in_memory: copy path into an in-memory database with the SQLite backup API, and index it
+    for lookups and substring searches; see :func:`get_memory_report` for what it cost.
+    """
+    path = str(path or os.environ.get('ZHLIB_DATABASE') or DEFAULT_PATH)
+    if in_memory:
+        immutable = False
+    elif immutable is None:
+        immutable = (path == DEFAULT_PATH)
+
+    if database.obj is not None:
+        getattr(database.obj, 'close_all', database.close)()
+
+    if _memory:
+        _memory.pop('connection').close()
+        _memory.clear()
+
+    return _open(path, immutable, pooled, max_connections, pragmas, in_memory)
+
+
+def _open(path, immutable, pooled, max_connections, pragmas, in_memory):
+    """Rest of configure(), which leaves connections to the previous database to whoever still uses them"""
+    if in_memory:
+        uri = _copy_into_memory(path)
+    elif immutable:
+        uri = Path(path).resolve().as_uri() + '?immutable=1'
+    else:
+        uri = Path(path).resolve().as_uri()
+
+    kwargs = dict(pragmas=dict(READ_PRAGMAS, **(pragmas or dict())), uri=True)
+    if pooled:
+        db = PooledSqliteDatabase(uri, max_connections=max_connections, **kwargs)
+    else:
+        db = pv.SqliteDatabase(uri, **kwargs)
+
+    database.initialize(db)
+    _config.clear()
+    _config.update(path=path, immutable=immutable, pooled=pooled,
+                   max_connections=max_connections, pragmas=pragmas, in_memory=in_memory)
+
+    _identity.clear()
+    if not in_memory:
+        _identity['current'] = _stat_identity(path)
+
+    for callback in _on_configure:
+        callback()
+
+    if in_memory:
+        _index_in_memory()
+
+    return database
+
+
+def _copy_into_memory(path):
+    """
+    Copy path into a shared-cache in-memory database, which lives as long as _memory['connection'] is open,
+    and which every thread's connection to the returned URI sees.
+    """
+    start = time.perf_counter()
+    uri = 'file:zhlib-{}?mode=memory&cache=shared'.format(next(_memory_ids))
+
+    source = sqlite3.connect(Path(path).resolve().as_uri() + '?mode=ro', uri=True)
+    target = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+
+    _memory.update(connection=target, copy_seconds=time.perf_counter() - start)
+    return uri
 
-from .util import find_hanzi, find_vocab, sort_vocab
 
-database = pv.SqliteDatabase(str(Path(__file__).with_name('dict.db')), pragmas={
-    'query_only': 'ON'
-})
-radical_finder = RadicalFinder()
+def _index_in_memory():
+    start = time.perf_counter()
+    with writable():
+        for model, column in [(Vocab, 'simplified'), (Vocab, 'traditional')]:
+            if model.table_exists():
+                table = model._meta.table_name
+                database.execute_sql(f'CREATE INDEX IF NOT EXISTS "{table}_{column}" ON "{table}" ("{column}")')
+
+        build_link_indexes()
+
+    if Vocab.table_exists() and Sentence.table_exists() and not has_ngram_index():
+        build_ngram_index()
+
+    page_count, = database.execute_sql('PRAGMA page_count').fetchone()
+    page_size, = database.execute_sql('PRAGMA page_size').fetchone()
+    _memory.update(index_seconds=time.perf_counter() - start, bytes=page_count * page_size)
+
+    logging.getLogger(__name__).info(
+        'Loaded %s into memory: %.2f s copying, %.2f s indexing, %.1f MiB',
+        _config['path'], _memory['copy_seconds'], _memory['index_seconds'], _memory['bytes'] / 1024 ** 2
+    )
+
+
+def get_memory_report():
+    """
+    :return: ``{'copy_seconds', 'index_seconds', 'bytes'}`` of the database loaded by ``configure(in_memory=True)``,
+    or None if it is on disk
+    """
+    if not _memory:
+        return None
+
+    return dict((k, v) for k, v in _memory.items() if k != 'connection')
+
+
+def database_identity():
+    """
+    ``(path, mtime, size)`` of the database file, which changes whenever it is written to or replaced;
+    None for an in-memory database, whose changes it cannot tell, so that results are not cached.
+
+    When it changes (outside of writable() and of transactions), new connections are opened for what follows,
+    as connections keep reading the file they were opened on if it is replaced, and may not see changes at all
+    if it was opened immutable. Open cursors keep their connection until they are done with it.
+    """
+    if _config['in_memory']:
+        return None
+
+    identity = _stat_identity(_config['path'])
+    if identity != _identity.get('current') and _writable_depth == 0 and not database.in_transaction():
+        with _identity_lock:
+            if _stat_identity(_config['path']) != _identity.get('current'):
+                _open(**get_config())
+
+        identity = _identity['current']
+
+    return identity
+
+
+def _stat_identity(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path, None, None
+
+    return path, st.st_mtime_ns, st.st_size
+
+
+def cache_info():
+    """Hit / miss counters of search() and the to_json methods"""
+    return dict(search=search_cache.info(), json=json_cache.info())
+
+
+def get_config():
+    """Arguments of the last :func:`configure`, e.g. to configure a worker process the same way"""
+    return dict(_config)
+
+
+@contextmanager
+def writable():
+    """Temporarily lift ``query_only`` (and ``immutable``), for build steps and migrations."""
+    global _writable_depth
+
+    config = get_config()
+    if _writable_depth == 0:
+        if config['immutable']:
+            configure(**dict(config, immutable=False))
+
+        database.pragma('query_only', 'OFF')
+
+    _writable_depth += 1
+    try:
+        yield database
+    finally:
+        _writable_depth -= 1
+        if _writable_depth == 0:
+            database.pragma('query_only', 'ON')
+            if config['immutable']:
+                configure(**config)
+
+
+configure()
+
+
+def get_radical_finder():
+    """cjkradlib.RadicalFinder takes most of a second to build, so only do it when first needed."""
+    global _radical_finder
+    if _radical_finder is None:
+        from cjkradlib import RadicalFinder
+        _radical_finder = RadicalFinder()
+
+    return _radical_finder
+
+
+def __getattr__(name):
+    if name == 'radical_finder':
+        return get_radical_finder()
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def warmup():
+    """
+    Initialize everything that is otherwise loaded lazily, for long-running servers
+    that would rather pay for it at startup than on their first requests.
+    """
+    import jieba
+
+    database.connect(reuse_if_open=True)
+    get_radical_finder()
+    jieba.initialize()
+    word_frequency('的', 'zh')
+    get_junda_table()
 
 
 class BaseModel(signals.Model):
@@ -30,6 +285,32 @@ class BaseModel(signals.Model):
         
         return d
 
+    @classmethod
+    def to_json_many(cls, models):
+        """
+        Same as ``[m.to_json() for m in models]``. Results are cached by id, see json_cache,
+        except for unsaved or modified instances.
+        """
+        models = list(models)
+        identity = database_identity()
+        keys = [(cls.__name__, m.id, identity) if identity and m.id is not None and not m.is_dirty() else None
+                for m in models]
+        results = [json_cache.get(k) if k else None for k in keys]
+
+        missing = [i for i, r in enumerate(results) if r is None]
+        if missing:
+            for i, result in zip(missing, cls._to_json_many([models[i] for i in missing])):
+                results[i] = result
+                if keys[i]:
+                    json_cache[keys[i]] = result
+
+        # Callers are free to modify what they get
+        return [dict((k, list(v) if isinstance(v, list) else v) for k, v in r.items()) for r in results]
+
+    @classmethod
+    def _to_json_many(cls, models):
+        return [BaseModel.to_json(m) for m in models]
+
     def __iter__(self):
         return iter(self.to_json().items())
 
@@ -55,8 +336,6 @@ class Hanzi(BaseModel):
     # sentences
     tags = pv.ManyToManyField(Tag, backref='hanzis', on_delete='cascade')
 
-    cache = dict()
-
     def __str__(self):
         return '{hanzi} {pinyin} {meaning}'.format(**dict(
             hanzi=self.hanzi,
@@ -64,48 +343,89 @@ class Hanzi(BaseModel):
             meaning=(self.meaning if self.meaning else '')
         ))
 
+    @classmethod
+    def get_many(cls, hanzis, chunk_size=CHUNK_SIZE):
+        result = dict()
+        for chunk in chunks(hanzis, chunk_size):
+            for db_hanzi in cls.select().where(cls.hanzi.in_(chunk)):
+                result[db_hanzi.hanzi] = db_hanzi
+
+        return result
+
     @property
     def more_vocabs(self):
-        return Vocab.select().where(
-            Vocab.simplified.contains(self.hanzi) | Vocab.traditional.contains(self.hanzi)
-        )
+        return Vocab.search(self.hanzi)
 
     def get_vocabs(self, limit=None):
-        return sort_vocab(set(self.vocabs) | set(self.more_vocabs), limit=limit)
+        query = Vocab.select().where(
+            Vocab.id.in_(VocabHanzi.select(VocabHanzi.vocab).where(VocabHanzi.hanzi == self.id))
+            | Vocab.search_expr(self.hanzi)
+        ).order_by(*Vocab.frequency_order())
+
+        if limit:
+            query = query.limit(limit)
+
+        return list(query)
 
     @property
     def more_sentences(self):
-        return Sentence.select().where(Sentence.sentence.contains(self.hanzi))
+        return Sentence.search(self.hanzi)
 
-    def get_sentences(self, limit=None):
-        i = 0
-        for sentence in self.sentences:
-            if not limit or (limit and i < limit):
-                yield sentence
-            i += 1
+    def get_sentences(self, limit=None, order_by=None):
+        """
+        Linked sentences and sentences containing the hanzi, deduplicated, in one query.
 
-        for sentence in self.more_sentences:
-            if not limit or (limit and i < limit):
-                yield sentence
-            i += 1
+        :param limit: pushed down to SQL as LIMIT
+        :param order_by: optional ranking, e.g. ``Sentence.order`` or ``fn.LENGTH(Sentence.sentence)``;
+        by default linked sentences come first.
+        """
+        return _get_sentences(SentenceHanzi.sentence, SentenceHanzi.hanzi == self.id,
+                              Sentence.search_expr(self.hanzi), limit=limit, order_by=order_by)
 
     @property
     def _rad_result(self):
-        return self.cache\
-            .setdefault(self.hanzi, dict())\
-            .setdefault('rad_result', radical_finder.search(self.hanzi))
+        return get_radicals(self.hanzi)
 
     @property
     def compositions(self):
-        return getattr(self._rad_result, 'compositions', None)
+        return list(self._rad_result.compositions)
 
     @property
     def supercompositions(self):
-        return getattr(self._rad_result, 'supercompositions', None)
+        return list(self._rad_result.supercompositions)
 
     @property
     def variants(self):
-        return getattr(self._rad_result, 'variants', None)
+        return list(self._rad_result.variants)
+
+    @classmethod
+    def search_components(cls, *components, limit=None):
+        """
+        Hanzi containing all of components, at any depth (e.g. 氵 and 每 for 海, 嗨 ...), by Junda rank.
+        Uses the HanziComponent index if it is present; otherwise decomposes every Hanzi, which is slow.
+        """
+        if not components:
+            raise TypeError('search_components() needs at least one component')
+
+        components = set(components)
+        if _has_tables(HanziComponent):
+            ids = None
+            for component in components:
+                query = HanziComponent.select(HanziComponent.hanzi_id).where(HanziComponent.component == component)
+                ids = query if ids is None else (ids & query)
+
+            where = cls.id.in_(ids)
+        else:
+            where = cls.id.in_([
+                hanzi_id for hanzi_id, hanzi in cls.select(cls.id, cls.hanzi).tuples()
+                if components <= get_components(hanzi)
+            ])
+
+        query = cls.select().where(where).order_by(cls.junda.asc(nulls='LAST'), cls.id)
+        if limit:
+            query = query.limit(limit)
+
+        return query
 
     def to_dict(self):
         result = super(Hanzi, self).to_dict()
@@ -120,26 +440,149 @@ class Hanzi(BaseModel):
         return result
 
     def to_json(self):
-        result = super(Hanzi, self).to_json()
-        result.update({
-            'vocabs': sort_vocab(Vocab.search(self.hanzi), limit=10),
-            'sentences': [str(s) for s in
-                          Sentence.select().where(Sentence.sentence.contains(self.hanzi))][:10],
-            'tags': [t.name for t in self.tags]
-        })
-        result['vocabs'] = [str(v) for v in result['vocabs']]
+        return self.to_json_many([self])[0]
 
-        return result
+    @classmethod
+    def _to_json_many(cls, hanzis):
+        """Same as ``[h.to_json() for h in hanzis]``, but with a few queries for the whole batch."""
+        hanzis = list(hanzis)
+        vocabs = _top_k_many(dict(
+            (h.id, Vocab.search(h.hanzi).order_by(*Vocab.frequency_order()).limit(10)) for h in hanzis
+        ))
+        sentences = _top_k_many(dict((h.id, h.get_sentences(10)) for h in hanzis))
+        tags = _tag_names_many(HanziTag.hanzi, [h.id for h in hanzis])
+
+        results = []
+        for h in hanzis:
+            result = super(Hanzi, h).to_json()
+            result.update({
+                'vocabs': [str(v) for v in vocabs.get(h.id, [])],
+                'sentences': [str(s) for s in sentences.get(h.id, [])],
+                'tags': tags.get(h.id, [])
+            })
+            results.append(result)
+
+        return results
 
 
 HanziTag = Hanzi.tags.get_through_model()
 
+Radicals = namedtuple('Radicals', ('compositions', 'supercompositions', 'variants'))
+
+
+class HanziRadical(pv.Model):
+    """cjkradlib results, precomputed for every Hanzi by build_radical_table()"""
+    hanzi = pv.TextField(primary_key=True)
+    compositions = pv.TextField()       # Space separated
+    supercompositions = pv.TextField()
+    variants = pv.TextField()
+
+    class Meta:
+        database = database
+        without_rowid = True
+
+    def to_radicals(self):
+        return Radicals(tuple(self.compositions.split()),
+                        tuple(self.supercompositions.split()),
+                        tuple(self.variants.split()))
+
+
+@lru_cache(maxsize=RADICAL_CACHE_SIZE)
+def get_radicals(hanzi):
+    """
+    Compositions, supercompositions and variants of hanzi, read from HanziRadical if it is present;
+    otherwise computed by cjkradlib.
+    """
+    if _has_tables(HanziRadical):
+        db_radical = HanziRadical.get_or_none(HanziRadical.hanzi == hanzi)
+        if db_radical:
+            return db_radical.to_radicals()
+
+    result = get_radical_finder().search(hanzi)
+    return Radicals(tuple(result.compositions), tuple(result.supercompositions), tuple(result.variants))
+
+
+_on_configure.append(get_radicals.cache_clear)
+
+
+_junda = dict()
+
+
+def get_junda_table(check=True):
+    """
+    ``{hanzi: junda}`` of every Hanzi with a junda, loaded with one query on first use,
+    and again after the database has changed.
+
+    :param check: look for changes with database_identity(), which costs a stat() of the file;
+    if False, only changes it has already noticed, e.g. in search(), are taken into account.
+    Check once per batch of lookups.
+    """
+    if check:
+        database_identity()
+
+    table = _junda.get('table')
+    if table is None:
+        table = _junda['table'] = dict(
+            Hanzi.select(Hanzi.hanzi, Hanzi.junda).where(Hanzi.junda.is_null(False)).tuples()
+        )
+
+    return table
+
+
+get_junda_table.cache_clear = _junda.clear
+_on_configure.append(get_junda_table.cache_clear)
+
+
+def get_components(hanzi):
+    """Compositions of hanzi, and their compositions, recursively"""
+    result = set()
+    stack = [hanzi]
+    while stack:
+        for component in get_radicals(stack.pop()).compositions:
+            if component not in result and component != hanzi:
+                result.add(component)
+                stack.append(component)
+
+    return result
+
+
+class HanziComponent(pv.Model):
+    """Inverted index from each component (see get_components) to the Hanzi containing it"""
+    component = pv.TextField()
+    hanzi_id = pv.IntegerField()
+
+    class Meta:
+        database = database
+        primary_key = pv.CompositeKey('component', 'hanzi_id')
+        without_rowid = True
+
+
+class _VocabMetadata(pv.Metadata):
+    """Leaves frequency out of the fields that queries select, on databases without the column"""
+
+    @property
+    def sorted_fields(self):
+        if has_frequency():
+            return self._sorted_fields
+
+        return [f for f in self._sorted_fields if f.name != 'frequency']
+
+    @sorted_fields.setter
+    def sorted_fields(self, fields):
+        self._sorted_fields = fields
+
+    def _update_sorted_fields(self):
+        # Runs while the model is being defined, before the database can be asked
+        self._sorted_fields = list(self._sorted_field_list)
+        self.sorted_field_names = [f.name for f in self._sorted_fields]
+
 
 class Vocab(BaseModel):
     simplified = pv.TextField()
     traditional = pv.TextField(null=True)
     pinyin = pv.TextField(null=True)
     english = pv.TextField(null=True)
+    frequency = pv.FloatField(null=True, index=True)    # wordfreq.word_frequency(simplified, 'zh')
     hanzis = pv.ManyToManyField(Hanzi, backref='vocabs', on_delete='cascade')
     # sentences
     tags = pv.ManyToManyField(Tag, backref='vocabs', on_delete='cascade')
@@ -148,6 +591,7 @@ class Vocab(BaseModel):
         indexes = (
             (('simplified', 'traditional', 'pinyin'), True),
         )
+        model_metadata_class = _VocabMetadata
 
     def __str__(self):
         return '{simplified} {traditional} {pinyin} {english}'.format(**dict(
@@ -159,29 +603,36 @@ class Vocab(BaseModel):
 
     @property
     def more_sentences(self):
-        query = Sentence.sentence.contains(self.simplified)
-        if self.traditional:
-            query = (query | Sentence.sentence.contains(self.simplified))
+        return Sentence.select().where(self._more_sentences_expr())
 
-        return Sentence.select().where(query)
+    def _more_sentences_expr(self):
+        query = Sentence.search_expr(self.simplified)
+        if self.traditional:
+            query = (query | Sentence.search_expr(self.traditional))
 
-    def get_sentences(self, limit=None):
-        i = 0
-        for sentence in self.sentences:
-            if not limit or (limit and i < limit):
-                yield sentence
-            i += 1
+        return query
 
-        for sentence in self.more_sentences:
-            if not limit or (limit and i < limit):
-                yield sentence
-            i += 1
+    def get_sentences(self, limit=None, order_by=None):
+        """Same as :meth:`Hanzi.get_sentences`, for sentences containing the vocab."""
+        return _get_sentences(SentenceVocab.sentence, SentenceVocab.vocab == self.id,
+                              self._more_sentences_expr(), limit=limit, order_by=order_by)
 
     @classmethod
     def search(cls, vocab):
-        return cls.select().where(
-            cls.simplified.contains(vocab) | cls.traditional.contains(vocab)
-        )
+        return cls.select().where(cls.search_expr(vocab))
+
+    @classmethod
+    def frequency_order(cls):
+        # NULLs sort last in descending order, so unfilled rows do not need special casing.
+        if not has_frequency():
+            return [cls.id]
+
+        return [cls.frequency.desc(), cls.id]
+
+    @classmethod
+    def search_expr(cls, vocab):
+        return _substring_expr(VocabGram, VocabGram.vocab_id, cls.id,
+                               [cls.simplified, cls.traditional], vocab)
 
     @classmethod
     def match(cls, vocab):
@@ -189,8 +640,26 @@ class Vocab(BaseModel):
             (cls.simplified == vocab) | (cls.traditional == vocab)
         )
 
+    @classmethod
+    def match_many(cls, vocabs, chunk_size=CHUNK_SIZE):
+        """Batched :meth:`match`, returning ``{vocab: first matching Vocab}``."""
+        result = dict()
+        for chunk in chunks(vocabs, chunk_size):
+            query = cls.select().where(
+                cls.simplified.in_(chunk) | cls.traditional.in_(chunk)
+            ).order_by(cls.id)
+
+            keys = set(chunk)
+            for db_vocab in query:
+                for k in (db_vocab.simplified, db_vocab.traditional):
+                    if k in keys:
+                        result.setdefault(k, db_vocab)
+
+        return result
+
     def to_dict(self):
         result = super(Vocab, self).to_dict()
+        result.pop('frequency', None)
         result.update({
             'sentences': list(self.get_sentences(10))
         })
@@ -198,21 +667,55 @@ class Vocab(BaseModel):
         return result
 
     def to_json(self):
-        result = super(Vocab, self).to_json()
-        result.update({
-            'sentences': [str(s) for s in self.get_sentences(10)],
-            'tags': [t.name for t in self.tags]
-        })
+        return self.to_json_many([self])[0]
 
-        return result
+    @classmethod
+    def _to_json_many(cls, vocabs):
+        """Same as ``[v.to_json() for v in vocabs]``, but with a few queries for the whole batch."""
+        vocabs = list(vocabs)
+        sentences = _top_k_many(dict((v.id, v.get_sentences(10)) for v in vocabs))
+        tags = _tag_names_many(VocabTag.vocab, [v.id for v in vocabs])
+
+        results = []
+        for v in vocabs:
+            result = super(Vocab, v).to_json()
+            result.pop('frequency', None)
+            result.update({
+                'sentences': [str(s) for s in sentences.get(v.id, [])],
+                'tags': tags.get(v.id, [])
+            })
+            results.append(result)
+
+        return results
 
 
 VocabHanzi = Vocab.hanzis.get_through_model()
 VocabTag = Vocab.tags.get_through_model()
 
 
+class VocabGram(pv.Model):
+    """Character n-gram shadow table of Vocab.simplified and Vocab.traditional."""
+    gram = pv.TextField()
+    vocab_id = pv.IntegerField()
+
+    class Meta:
+        database = database
+        primary_key = pv.CompositeKey('gram', 'vocab_id')
+        without_rowid = True
+
+
+@signals.pre_save(sender=Vocab)
+def vocab_pre_save(model_class, instance, created):
+    if instance.frequency is None:
+        instance.frequency = word_frequency(instance.simplified, 'zh')
+
+
 @signals.post_save(sender=Vocab)
 def vocab_post_save(model_class, instance, created):
+    if has_ngram_index():
+        _index_grams(VocabGram, VocabGram.vocab_id, instance.id,
+                     [instance.simplified, instance.traditional], replace=not created)
+
     extra_hanzi = instance.traditional
     if not extra_hanzi:
         extra_hanzi = ''
@@ -238,6 +741,15 @@ class Sentence(BaseModel):
             (('sentence', 'pinyin'), True),
         )
 
+    @classmethod
+    def search(cls, sentence):
+        return cls.select().where(cls.search_expr(sentence))
+
+    @classmethod
+    def search_expr(cls, sentence):
+        return _substring_expr(SentenceGram, SentenceGram.sentence_id, cls.id,
+                               [cls.sentence], sentence)
+
     def __str__(self):
         return '{sentence} {pinyin} {english}'.format(**dict(
             sentence=self.sentence,
@@ -246,14 +758,27 @@ class Sentence(BaseModel):
         ))
 
     def to_json(self):
-        result = super(Sentence, self).to_json()
-        result.update({
-            'vocab': sort_vocab(set(v for v in self.vocabs), limit=10),
-            'tags': [t.name for t in self.tags]
-        })
-        result['vocab'] = [str(v) for v in result['vocab']]
+        return self.to_json_many([self])[0]
 
-        return result
+    @classmethod
+    def _to_json_many(cls, sentences):
+        """Same as ``[s.to_json() for s in sentences]``, but with a few queries for the whole batch."""
+        sentences = list(sentences)
+        vocabs = _top_k_many(dict(
+            (s.id, s.vocabs.order_by(*Vocab.frequency_order()).limit(10)) for s in sentences
+        ))
+        tags = _tag_names_many(SentenceTag.sentence, [s.id for s in sentences])
+
+        results = []
+        for s in sentences:
+            result = super(Sentence, s).to_json()
+            result.update({
+                'vocab': [str(v) for v in vocabs.get(s.id, [])],
+                'tags': tags.get(s.id, [])
+            })
+            results.append(result)
+
+        return results
 
 
 SentenceHanzi = Sentence.hanzis.get_through_model()
@@ -261,18 +786,31 @@ SentenceVocab = Sentence.vocabs.get_through_model()
 SentenceTag = Sentence.tags.get_through_model()
 
 
+class SentenceGram(pv.Model):
+    """Character n-gram shadow table of Sentence.sentence."""
+    gram = pv.TextField()
+    sentence_id = pv.IntegerField()
+
+    class Meta:
+        database = database
+        primary_key = pv.CompositeKey('gram', 'sentence_id')
+        without_rowid = True
+
+
 @signals.post_save(sender=Sentence)
 def sentence_post_save(model_class, instance, created):
+    if has_ngram_index():
+        _index_grams(SentenceGram, SentenceGram.sentence_id, instance.id,
+                     [instance.sentence], replace=not created)
+
     for hanzi in find_hanzi(instance.sentence):
         try:
-            Hanzi.get_or_create(hanzi=hanzi)[0].vocabs.add(instance)
+            Hanzi.get_or_create(hanzi=hanzi)[0].sentences.add(instance)
         except pv.IntegrityError:
             pass
 
     for vocab in find_vocab(instance.sentence):
-        db_vocab = Vocab.select(Vocab.simplified, Vocab.traditional).where(
-            (Vocab.simplified == vocab) | (Vocab.traditional == vocab)
-        )
+        db_vocab = Vocab.match(vocab)
 
         if not db_vocab:
             Vocab.create(simplified=vocab).sentences.add(instance)
@@ -283,15 +821,311 @@ def sentence_post_save(model_class, instance, created):
                 pass
 
 
+def _has_tables(*models):
+    key = (database.database,) + tuple(m._meta.table_name for m in models)
+    if key not in _table_exists:
+        _table_exists[key] = all(m.table_exists() for m in models)
+
+    return _table_exists[key]
+
+
+def has_ngram_index():
+    return _has_tables(VocabGram, SentenceGram)
+
+
+def has_frequency():
+    """
+    Whether the database has the Vocab.frequency column, or no Vocab table yet. Databases built before it need
+    ``python -m migration.add_frequency``; until then, Vocab are selected without it, and ordered by id.
+    """
+    key = (database.database, 'vocab.frequency')
+    if key not in _table_exists:
+        columns = database.get_columns('vocab')
+        _table_exists[key] = not columns or any(c.name == 'frequency' for c in columns)
+        if not _table_exists[key]:
+            logging.getLogger(__name__).warning(
+                '%s has no vocab.frequency column, so vocab are ordered by id; '
+                'run python -m migration.add_frequency to add it', _config['path']
+            )
+
+    return _table_exists[key]
+
+
+def _substring_expr(gram_model, ref_field, pk, fields, s):
+    """
+    ``field LIKE '%s%'`` for any of fields, narrowed down by the n-gram shadow table if it is present.
+    Strings up to GRAM_SIZE are looked up directly; longer ones intersect the postings of their n-grams.
+    Grams are ASCII-lowercased, as LIKE is case-insensitive for ASCII only.
+    """
+    expr = reduce(or_, (f.contains(s) for f in fields))
+    if not s or not has_ngram_index():
+        return expr
+
+    lower = ascii_lower(s)
+    if len(lower) <= GRAM_SIZE:
+        grams = [lower]
+    else:
+        grams = set(lower[i:i + GRAM_SIZE] for i in range(len(lower) - GRAM_SIZE + 1))
+
+    ids = None
+    for gram in grams:
+        query = gram_model.select(ref_field).where(gram_model.gram == gram)
+        ids = query if ids is None else (ids & query)
+
+    return pk.in_(ids) & expr
+
+
+def _get_sentences(linked_field, linked_where, expr, limit=None, order_by=None):
+    """
+    Sentences linked through linked_field where linked_where, and sentences matching expr, deduplicated.
+
+    By default linked sentences come first, then by id. With a limit, that is computed from the first
+    limit rows of each side, so that neither side is read, let alone sorted, beyond them.
+    """
+    linked = linked_field.model.select(linked_field).where(linked_where)
+    if order_by is not None or not limit:
+        is_linked = Sentence.id.in_(linked)
+        if order_by is None:
+            order_by = pv.Case(None, [(is_linked, 0)], 1)
+
+        query = Sentence.select().where(is_linked | expr).order_by(order_by, Sentence.id)
+        if limit:
+            query = query.limit(limit)
+
+        return query
+
+    # Members of a compound select cannot have their own LIMIT in SQLite, unless wrapped as subqueries.
+    top_linked = linked_field.model.select(linked_field.alias('sentence_id'), pv.Value(0).alias('rank')) \
+        .where(linked_where).order_by(linked_field).limit(limit)
+    top_matched = Sentence.select(Sentence.id.alias('sentence_id'), pv.Value(1).alias('rank')) \
+        .where(expr).order_by(Sentence.id).limit(limit)
+    candidates = (pv.Select([top_linked.alias('l')], [pv.SQL('*')])
+                  + pv.Select([top_matched.alias('m')], [pv.SQL('*')])).alias('candidates')
+
+    return Sentence.select().join(candidates, on=(Sentence.id == candidates.c.sentence_id)) \
+        .group_by(Sentence.id).order_by(pv.fn.MIN(candidates.c.rank), Sentence.id).limit(limit)
+
+
+def _top_k_many(queries, chunk_size=UNION_SIZE):
+    """
+    Run ``{key: query}`` as UNION ALL of the (limited, ordered) queries, one round trip per chunk.
+    Each member numbers its rows by its own ORDER BY, and the outer query sorts on that number,
+    as SQL does not keep the order of subqueries.
+
+    :return: ``{key: [model instances]}``
+    """
+    result = dict()
+    for chunk in chunks(queries.items(), chunk_size):
+        union = reduce(add, (
+            pv.Select([query.select_extend(
+                pv.Value(key).alias('_key'),
+                pv.fn.ROW_NUMBER().over(order_by=query._order_by).alias('_rank')
+            )], [pv.SQL('*')])
+            for key, query in chunk
+        ))
+        model = chunk[0][1].model
+        for row in model.select(pv.SQL('*')).from_(union.alias('u')).order_by(pv.SQL('_key'), pv.SQL('_rank')):
+            result.setdefault(row._key, []).append(row)
+
+    return result
+
+
+def _tag_names_many(owner_field, ids):
+    """``{owner id: [tag names]}`` for the through model of owner_field"""
+    through = owner_field.model
+    result = dict()
+    for chunk in chunks(set(ids), CHUNK_SIZE):
+        query = through.select(owner_field, Tag.name).join(Tag).where(owner_field.in_(chunk)).order_by(Tag.id)
+        for owner_id, name in query.tuples():
+            result.setdefault(owner_id, []).append(name)
+
+    return result
+
+
+def _index_grams(gram_model, ref_field, ref_id, texts, replace=False):
+    if replace:
+        gram_model.delete().where(ref_field == ref_id).execute()
+
+    rows = [(gram, ref_id) for gram in set().union(*(ngrams(t) for t in texts if t))]
+    for chunk in chunks(rows, CHUNK_SIZE // 2):
+        gram_model.insert_many(chunk, fields=[gram_model.gram, ref_field]).on_conflict_ignore().execute()
+
+
+def build_ngram_index():
+    """(Re)build VocabGram and SentenceGram, so that substring searches stop scanning whole tables."""
+    with writable(), database.atomic():
+        database.drop_tables([VocabGram, SentenceGram])
+        database.create_tables([VocabGram, SentenceGram])
+
+        for vocab_id, simplified, traditional in Vocab.select(
+            Vocab.id, Vocab.simplified, Vocab.traditional
+        ).tuples().iterator():
+            _index_grams(VocabGram, VocabGram.vocab_id, vocab_id, [simplified, traditional])
+
+        for sentence_id, sentence in Sentence.select(Sentence.id, Sentence.sentence).tuples().iterator():
+            _index_grams(SentenceGram, SentenceGram.sentence_id, sentence_id, [sentence])
+
+    _table_exists.clear()
+
+
+def update_ngram_index():
+    """
+    Index the Vocab and Sentence rows that are missing from the n-gram index, if there is one,
+    e.g. after bulk inserts, which do not fire the post_save signals.
+    """
+    if not has_ngram_index():
+        return
+
+    with writable(), database.atomic():
+        for vocab_id, simplified, traditional in list(Vocab.select(
+            Vocab.id, Vocab.simplified, Vocab.traditional
+        ).where(Vocab.id.not_in(VocabGram.select(VocabGram.vocab_id))).tuples()):
+            _index_grams(VocabGram, VocabGram.vocab_id, vocab_id, [simplified, traditional])
+
+        for sentence_id, sentence in list(Sentence.select(
+            Sentence.id, Sentence.sentence
+        ).where(Sentence.id.not_in(SentenceGram.select(SentenceGram.sentence_id))).tuples()):
+            _index_grams(SentenceGram, SentenceGram.sentence_id, sentence_id, [sentence])
+
+
+def build_radical_table():
+    """(Re)build HanziRadical for every Hanzi, so that no radical lookup has to run cjkradlib."""
+    with writable(), database.atomic():
+        database.drop_tables([HanziRadical])
+        database.create_tables([HanziRadical])
+
+        rows = []
+        for hanzi, in Hanzi.select(Hanzi.hanzi).tuples():
+            result = get_radical_finder().search(hanzi)
+            rows.append((hanzi, ' '.join(result.compositions),
+                         ' '.join(result.supercompositions), ' '.join(result.variants)))
+
+        for chunk in chunks(rows, CHUNK_SIZE // 4):
+            HanziRadical.insert_many(chunk).execute()
+
+    _table_exists.clear()
+    get_radicals.cache_clear()
+
+
+def build_component_index():
+    """(Re)build HanziComponent, for Hanzi.search_components. Faster after build_radical_table()."""
+    with writable(), database.atomic():
+        database.drop_tables([HanziComponent])
+        database.create_tables([HanziComponent])
+
+        rows = ((component, hanzi_id) for hanzi_id, hanzi in Hanzi.select(Hanzi.id, Hanzi.hanzi).tuples()
+                for component in get_components(hanzi))
+        for chunk in chunks(rows, CHUNK_SIZE // 2):
+            HanziComponent.insert_many(chunk, fields=[HanziComponent.component, HanziComponent.hanzi_id]).execute()
+
+    _table_exists.clear()
+
+
+def build_link_indexes():
+    """
+    Index relation tables from the hanzi / vocab side, covering the sentence / vocab side,
+    so that "first N linked sentences by id" reads N index entries.
+    """
+    with writable():
+        for model, columns in [(VocabHanzi, ('hanzi_id', 'vocab_id')),
+                               (SentenceHanzi, ('hanzi_id', 'sentence_id')),
+                               (SentenceVocab, ('vocab_id', 'sentence_id'))]:
+            if model.table_exists():
+                table = model._meta.table_name
+                database.execute_sql('CREATE INDEX IF NOT EXISTS "{}" ON "{}" ({})'.format(
+                    '_'.join((table,) + columns), table, ', '.join(f'"{c}"' for c in columns)
+                ))
+
+
+def build_frequency():
+    """Fill Vocab.frequency, so that "top N vocab" is an indexed ORDER BY ... LIMIT N."""
+    with writable(), database.atomic():
+        rows = Vocab.select(Vocab.id, Vocab.simplified).tuples().iterator()
+        for chunk in chunks(rows, CHUNK_SIZE // 2):
+            Vocab.update(
+                frequency=pv.Case(Vocab.id, [(vocab_id, word_frequency(simplified, 'zh'))
+                                             for vocab_id, simplified in chunk])
+            ).where(Vocab.id.in_([vocab_id for vocab_id, _ in chunk])).execute()
+
+    _table_exists.clear()
+
+
 def search(s):
+    """Exact-match lookup of s as hanzi, vocab and sentence. Results are cached, see search_cache."""
+    identity = database_identity()
+    if identity is None:
+        return _search(s)
+
+    key = (s, identity)
+    result = search_cache.get(key)
+    if result is None:
+        result = search_cache[key] = _search(s)
+
+    # Callers are free to modify what they get
+    return copy.deepcopy(result)
+
+
+def search_many(strings, chunk_size=CHUNK_SIZE):
+    """
+    Same as ``[search(s) for s in strings]``, but with grouped queries,
+    and with to_json_many over everything found at once.
+    """
+    strings = list(strings)
+    identity = database_identity()
+    results = dict()
+    for s in set(strings):
+        result = search_cache.get((s, identity)) if identity else None
+        if result is not None:
+            results[s] = result
+
+    missing = sorted(set(strings) - set(results.keys()))
+    hanzis = dict()
+    vocabs = dict()
+    sentences = dict()
+    for chunk in chunks(missing, chunk_size):
+        single = [s for s in chunk if len(s) == 1]
+        multiple = [s for s in chunk if len(s) > 1]
+
+        if single:
+            hanzis.update(Hanzi.get_many(single))
+        for db_vocab in Vocab.select().where(Vocab.simplified.in_(chunk) | Vocab.traditional.in_(chunk)).order_by(Vocab.id):
+            # The other form may be in another chunk, which fetches the row again
+            for k in set(filter(None, (db_vocab.simplified, db_vocab.traditional))) & set(chunk):
+                vocabs.setdefault(k, []).append(db_vocab)
+        if multiple:
+            for db_sentence in Sentence.select().where(Sentence.sentence.in_(multiple)).order_by(Sentence.id):
+                sentences.setdefault(db_sentence.sentence, []).append(db_sentence)
+
+    json_hanzis = _to_json_by_id(Hanzi, hanzis.values())
+    json_vocabs = _to_json_by_id(Vocab, (v for vs in vocabs.values() for v in vs))
+    json_sentences = _to_json_by_id(Sentence, (v for vs in sentences.values() for v in vs))
+
+    for s in missing:
+        results[s] = _search_result({
+            'hanzi': [json_hanzis[hanzis[s].id]] if s in hanzis else [],
+            'vocab': [json_vocabs[v.id] for v in vocabs.get(s, [])],
+            'sentences': [json_sentences[v.id] for v in sentences.get(s, [])]
+        })
+        if identity:
+            search_cache[(s, identity)] = results[s]
+
+    return [copy.deepcopy(results[s]) for s in strings]
+
+
+def _to_json_by_id(model, models):
+    models = list(dict((m.id, m) for m in models).values())
+    return dict(zip((m.id for m in models), model.to_json_many(models)))
+
+
+def _search(s):
     sentences = ''
     if len(s) > 1:
-        sentences = Sentence.select().where(Sentence.sentence == s)
+        sentences = Sentence.select().where(Sentence.sentence == s).order_by(Sentence.id)
     hanzis = ''
     if len(s) == 1:
         hanzis = Hanzi.select().where(Hanzi.hanzi == s)
 
-    vocabs = Vocab.match(s)
+    vocabs = Vocab.match(s).order_by(Vocab.id)
 
     d = {
         'hanzi': hanzis,
@@ -299,12 +1133,18 @@ def search(s):
         'sentences': sentences
     }
 
+    for k, v in d.items():
+        if len(v) > 0:
+            d[k] = v.model.to_json_many(v)
+
+    return _search_result(d)
+
+
+def _search_result(d):
     to_pop = []
     for k, v in d.items():
         if len(v) == 0:
             to_pop.append(k)
-        else:
-            d[k] = [x.to_json() for x in v]
 
     for k in to_pop:
         d.pop(k)